@@ -1,6 +1,13 @@
+import logging
 import math
+import os
 import random
 
+#Debug tracing goes through logging , set CACHE_LOG_LEVEL=DEBUG to see it.
+#The hot path only tests the debug flag , so nothing is formatted when it is off.
+log = logging.getLogger(__name__)
+debug = False
+
 class Cache:
     """
     A class used to represent Cache
@@ -51,11 +58,9 @@ class Cache:
         addr = self.hex_2_bin(string)
         #print(addr)
         #access_type = int(addr[0])
-        print(access)
+        if( debug ): log.debug("%s %s", access, addr)
         #addr = addr[1:]
         #addr = string
-        print(addr)
-        print("-----")
         access_type = 1 if access == 'w' else 0
         self.metrics.update(['cache_access'])
         if( access_type == 0):
@@ -139,7 +144,7 @@ class bbox:
         if( self.associativity != 1):
             #go to the set
             cache_set = self.sets[self.set_num(addr)]
-            print("set num = ",self.set_num(addr))
+            if( debug ): log.debug("set num = %d", self.set_num(addr))
             self.cache.replacer(addr, access_type, self.tag(addr), self.set_num(addr), cache_set)         
 
 
@@ -197,7 +202,7 @@ class replacer:
                     return
 
                 #random
-                if( self.cache.bbox.associativity == 0): self.cache.metrics.update('capacity_misses')
+                if( self.cache.bbox.associativity == 0): self.cache.metrics.update('capacity_miss')
                 self.cache.metrics.update('conflict_miss')
 
                 randomizer = random.randint(0, self.cache.bbox.ways)
@@ -224,7 +229,7 @@ class replacer:
                     prev = curr
                     curr = curr.next
                 if( curr != None and curr.tag == tag):
-                    print("{tag = ", tag, "} already prensent ")
+                    if( debug ): log.debug("{tag = %s} already present", tag)
                     if( prev != None ): prev.next = curr.next
                     temp = cache_set.head
                     cache_set.head = curr
@@ -245,9 +250,9 @@ class replacer:
                     prev = curr
                     curr = curr.next
                 if( curr == None ):
-                    print("{tag = ", tag, "} cache full, evicting {prev.tag" , prev.tag , "}")
+                    if( debug ): log.debug("{tag = %s} cache full, evicting {prev.tag = %s}", tag, prev.tag)
                     if( prev.dirty_bit == True): self.cache.metrics.update('dirty_evicted')
-                    if( self.cache.bbox.associativity == 0): self.cache.metrics.update('capacity_misses')
+                    if( self.cache.bbox.associativity == 0): self.cache.metrics.update('capacity_miss')
                     self.cache.metrics.update('conflict_miss')
                     #update? remove the last block in linked list
 
@@ -259,7 +264,7 @@ class replacer:
                     return
 
                 if( curr.valid_bit == False ):
-                    print("{tag = ", tag, "} invlaid found ")
+                    if( debug ): log.debug("{tag = %s} invalid found", tag)
                     #update
                     self.cache.metrics.update('compulsory_miss')
                     curr.tag = tag
@@ -304,7 +309,7 @@ class replacer:
                 
                 # capacity miss
                 if( hit_status == -1):
-                    if( self.cache.bbox.associativity == 0): self.cache.metrics.update('capacity_misses')
+                    if( self.cache.bbox.associativity == 0): self.cache.metrics.update('capacity_miss')
                     self.cache.metrics.update('conflict_miss')
 
 
@@ -324,7 +329,7 @@ class replacer:
     def print_cache(self, head):
         curr = head
         while( curr != None ):
-            print( curr.tag , "->") 
+            log.debug("%s ->", curr.tag)
             curr = curr.next            
 
 
@@ -357,9 +362,7 @@ class Pseudo_LRU:
                 pos = 2*pos + (d+1)
             ans = self.tree[set_num][pos]
             self.tree[set_num][pos] = tag
-            for i in range( 2*self.ways - 1):
-                print(self.tree[set_num][i] , end = " -- ")
-            print( " tree completed")
+            if( debug ): self.log_tree(set_num)
             return ans
         
         pos = 0
@@ -373,9 +376,10 @@ class Pseudo_LRU:
             self.tree[set_num][d] ^= ((pos %2) ^ self.tree[set_num][d])
             pos = d
         
-        for i in range( 2*self.ways - 1):
-                print(self.tree[set_num][i] , end = " -- ")
-        print( " tree completed")
+        if( debug ): self.log_tree(set_num)
+
+    def log_tree(self, set_num):
+        log.debug("%s tree completed", " -- ".join(str(node) for node in self.tree[set_num]))
 
 
 # Linked List class contains a Node object 
@@ -400,14 +404,27 @@ class cache_set:
         
 
 
+logging.basicConfig(level = os.environ.get('CACHE_LOG_LEVEL', 'WARNING'))
+debug = log.isEnabledFor(logging.DEBUG)
+
 f = open( './assignment6/input.txt', 'r')
 
-x = f.readlines()
-cache_size, cache_linesize , dm_cache , replacement_policy = x[:4]
+#header : the first four non blank lines, '#' starts a comment
+x = []
+while( len(x) < 4 ):
+    line = f.readline()
+    if( line == '' ): raise ValueError("input file ended inside the header")
+    line = line.split('#', 1)[0].strip()
+    if( line != '' ): x.append(line)
+cache_size, cache_linesize , dm_cache , replacement_policy = x
 cache = Cache(int(dm_cache.strip()),int(replacement_policy.strip()),int(cache_size.strip()),int(cache_linesize.strip()) )
 #print(cache_size.strip(), '----',cache_linesize.strip(), '----', dm_cache.strip())
-for i in x[4:]:
-    addr, access = i.split()
+
+#requests are streamed one line at a time instead of reading the whole file
+for i in f:
+    fields = i.split('#', 1)[0].split()
+    if( len(fields) < 2 or fields[1] not in ('r', 'w') ): continue
+    addr, access = fields[0], fields[1]
     cache.access(addr.strip(), access.strip())
     #print(addr, '----', access)
 
@@ -10,91 +10,257 @@ Note : Require Python 2.7 or more version to run.
 """
 
 
+import bisect
 import math
+import mmap
+import multiprocessing
+import os
+import pickle
 import random
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from collections import OrderedDict
+
+#numpy is only needed for the vectorized batch mode
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 #########################################################################################
-#cache Block 
-class cache_block: 
+#Represents the Cache Blocks
+class cache_blocks: 
     """
-    A cache block class
+    Every block of the cache in flat arrays , set s owns the slots
+    s * ways to s * ways + ways - 1 and way w of it is slot s * ways + w
 
     Attributes:
     -----------
 
-    tag: tag in the block
+    ways: number of ways of a set
 
-    valid_bit: validity of the cache block, empty or containing a valid tag
+    tags: tag held in each slot (-1 while the slot is empty)
 
-    dirty_bit: If the data is written to the address in the block
+    valid_bits: validity of each slot, empty or containing a valid tag
 
+    dirty_bits: If the data is written to the address held in the slot
+
+    way_of: dict mapping the block number (tag and set) of every valid block to its way ,
+            None with one way per set , the tag is then compared in place
+
+    evicted_tag, evicted_dirty: tag and dirty bit of the last block a fill replaced
 
     """
-    def __init__(self, tag, valid_bit, dirty_bit, next): 
-        self.tag = tag  # Assign data 
-        self.valid_bit = valid_bit
-        self.dirty_bit = dirty_bit
-        self.next = next  
-    def __call__(self, tag, valid_bit, dirty_bit):
-        self.tag = tag
-        self.valid_bit = valid_bit
-        self.dirty_bit = dirty_bit
+    def __init__(self, num_sets, ways): 
+        self.ways = ways
+        self.enum_sets = int(math.log2(num_sets))
+        self.tags = array('q', [-1]) * (num_sets * ways)
+        self.valid_bits = bytearray(num_sets * ways)
+        self.dirty_bits = bytearray(num_sets * ways)
+        self.way_of = dict() if ways > 1 else None
+        self.evicted_tag = -1
+        self.evicted_dirty = 0
+
+    def lookup(self, tag, set_num):
+        """
+        returns the way of the set holding the tag, -1 if the tag is not in the set
+        """
+        if( self.way_of is None ): return 0 if self.tags[set_num] == tag else -1
+        return self.way_of.get((tag << self.enum_sets) | set_num, -1)
+
+    def empty_way(self, set_num):
+        """
+        returns the first invalid way of the set, -1 if the set is full
+        """
+        base = set_num * self.ways
+        slot = self.valid_bits.find(0, base, base + self.ways)
+        return slot - base if slot != -1 else -1
 
-############################################################################################ 
-# Linked List class contains a Node object 
-#Represents Cache Set
-class cache_set: 
-    # Function to initialize head 
-    def __init__(self, ways): 
-        self.head = self.create_list(ways)
+    def fill(self, set_num, way, tag, dirty_bit):
+        """
+        Places the tag in the way, dropping whatever tag was there before
+        """
+        slot = set_num * self.ways + way
+        tags, way_of = self.tags, self.way_of
+        if( self.valid_bits[slot] ):
+            self.evicted_tag = tags[slot]
+            self.evicted_dirty = self.dirty_bits[slot]
+            if( way_of is not None ): del way_of[(tags[slot] << self.enum_sets) | set_num]
+        else:
+            self.valid_bits[slot] = 1
+        tags[slot] = tag
+        self.dirty_bits[slot] = dirty_bit
+        if( way_of is not None ): way_of[(tag << self.enum_sets) | set_num] = way
 
+    def invalidate(self, set_num, way):
+        """
+        Empties the way
+        """
+        slot = set_num * self.ways + way
+        if( self.way_of is not None ): del self.way_of[(self.tags[slot] << self.enum_sets) | set_num]
+        self.tags[slot] = -1
+        self.valid_bits[slot] = 0
+        self.dirty_bits[slot] = 0
 
-    def create_list(self, length):
-        linked_list_head = cache_block("",0,0,None)
-        tail =  linked_list_head
-        #Linking
-        for _ in  range(1, length):
-            tail.next = cache_block("",0,0,None)
-            tail = tail.next
-        return linked_list_head
 #############################################################################################        
 #Performance Counters for the cache
+#every counter is one slot of cache_metric.counts , at the index of its constant
+METRIC_NAMES = ('cache_access', 'read_access', 'write_access', 'cache_miss', 'compulsory_miss',
+                'capacity_miss', 'conflict_miss', 'read_miss', 'write_miss', 'dirty_evicted',
+                'memory_read_bytes', 'writeback_bytes', 'write_through_bytes')
+(CACHE_ACCESS, READ_ACCESS, WRITE_ACCESS, CACHE_MISS, COMPULSORY_MISS, CAPACITY_MISS, CONFLICT_MISS,
+ READ_MISS, WRITE_MISS, DIRTY_EVICTED, MEMORY_READ_BYTES, WRITEBACK_BYTES, WRITE_THROUGH_BYTES) = range(len(METRIC_NAMES))
+METRIC_INDEX = {string : i for i, string in enumerate(METRIC_NAMES)}
+
 class cache_metric:
     """
     A class to keep track of the cache_metrics
 
+    The counters are one list indexed by the counter constants , the hot
+    path bumps them by index. Every counter is also a named attribute
+    (cache_access , read_access ...) and a misspelt counter name raises a
+    KeyError instead of quietly starting a new counter.
+
     Attributes
     ----------
-    The Attributes that need to be measured
+    counts : list
+        The counters , in METRIC_NAMES order
 
     Methods
     -------
-    update(str)
-        Increments the "str" metric by 1
+    update(tuple)
+        Increments every counter of the tuple of indices by 1
+
+    add(str, int)
+        Increments the "str" metric by the given count
 
+    as_dict()
+        returns the counters as a dict , in print order
     """
+    __slots__ = ('counts',)
+
     def __init__(self,associativity , replacement_policy ):
-        self.cache_access = 0
-        self.read_access = 0
-        self.write_access = 0
-        self.cache_miss = 0
-        self.compulsory_miss = 0
-        self.capacity_miss = 0
-        self.conflict_miss = 0
-        self.read_miss = 0
-        self.write_miss = 0
-        self.dirty_evicted = 0
-
-    def update(self, strings):
-        if type(strings) == str:
-            self.__dict__[strings] += 1
-        else:
-            for string in strings:
-                self.__dict__[string] += 1
+        self.counts = [0] * len(METRIC_NAMES)
+
+    def update(self, indices):
+        counts = self.counts
+        for i in indices:
+            counts[i] += 1
+
+    def add(self, string, count):
+        try:
+            self.counts[METRIC_INDEX[string]] += int(count)
+        except KeyError:
+            raise KeyError("unknown cache metric " + repr(string))
+
+    def as_dict(self):
+        return dict(zip(METRIC_NAMES, self.counts))
 
     def print_metrics(self):
-        for k,v in self.__dict__.items():
-            print( k ," = ", v)
+        for k, count in zip(METRIC_NAMES, self.counts):
+            print( k ," = ", count)
+
+def metric_property(i):
+    #the named attribute of counter i
+    def get(self): return self.counts[i]
+    def set(self, value): self.counts[i] = value
+    return property(get, set)
+
+for i, string in enumerate(METRIC_NAMES):
+    setattr(cache_metric, string, metric_property(i))
+
+#Indices of the counters bumped by one request , indexed by access type (1 = write).
+#A miss adds its kind : compulsory_miss, capacity_miss or conflict_miss.
+HIT_COUNTERS = ((CACHE_ACCESS, READ_ACCESS), (CACHE_ACCESS, WRITE_ACCESS))
+MISS_COUNTERS = tuple({kind : HIT_COUNTERS[access_type] + (CACHE_MISS, (READ_MISS, WRITE_MISS)[access_type], METRIC_INDEX[kind])
+                       for kind in ('compulsory_miss', 'capacity_miss', 'conflict_miss')} for access_type in (0, 1))
+#############################################################################################
+#Compulsory miss tracking
+class first_touch:
+    """
+    Remembers which blocks have been touched, to tell compulsory misses apart
+
+    Blocks are kept in a set while the trace is sparse. Once the set would
+    take more memory than one bit per block of the address space, the blocks
+    move to a bitmap of 2^(32 - block offset bits) bits.
+
+    Attributes
+    ----------
+    blocks:set
+        Touched blocks (in bitmap mode only blocks beyond the 32 bit space)
+
+    bitmap:bytearray
+        One bit per block, None while in set mode
+
+    count:int
+        Number of distinct blocks touched
+
+    Methods
+    -------
+    touch(int)
+        Marks the block, returns True if it had never been touched
+
+    touch_many(list)
+        Marks distinct blocks, returns how many had never been touched
+
+    memory()
+        returns the approximate number of bytes used
+    """
+    #rough cost of one int in a set : hash table slot plus the int object
+    SET_ENTRY_BYTES = 64
+
+    def __init__(self, eblock_size):
+        self.num_blocks = 1 << (32 - eblock_size)
+        self.blocks = set()
+        self.bitmap = None
+        self.count = 0
+        self.limit = (self.num_blocks // 8) // self.SET_ENTRY_BYTES
+
+    def touch(self, block):
+        bitmap = self.bitmap
+        if( bitmap is not None and block < self.num_blocks ):
+            mask = 1 << (block & 7)
+            if( bitmap[block >> 3] & mask ): return False
+            bitmap[block >> 3] |= mask
+        else:
+            if( block in self.blocks ): return False
+            self.blocks.add(block)
+            if( bitmap is None and len(self.blocks) > self.limit ): self.to_bitmap()
+        self.count += 1
+        return True
+
+    def touch_many(self, blocks):
+        new = 0
+        if( self.bitmap is None ):
+            blocks = set(blocks).difference(self.blocks)
+            self.blocks |= blocks
+            self.count += len(blocks)
+            if( len(self.blocks) > self.limit ): self.to_bitmap()
+            return len(blocks)
+        for block in blocks:
+            if( self.touch(block) ): new += 1
+        return new
+
+    def to_bitmap(self):
+        bitmap = bytearray(self.num_blocks // 8 + 1)
+        outside = set()
+        for block in self.blocks:
+            if( block < self.num_blocks ): bitmap[block >> 3] |= 1 << (block & 7)
+            else: outside.add(block)
+        self.bitmap = bitmap
+        self.blocks = outside
+
+    def memory(self):
+        size = sys.getsizeof(self.blocks) + self.SET_ENTRY_BYTES * len(self.blocks) // 2
+        if( self.bitmap is not None ): size += sys.getsizeof(self.bitmap)
+        return size
+
+    def mode(self):
+        return 'set' if self.bitmap is None else 'bitmap'
+
 ################################################# Cache ####################################################
 class Cache:
     """
@@ -113,18 +279,66 @@ class Cache:
         An object to handle the complexities of associativity
     replacer : replacer
         An object for handling replacement policies
+    exact_3c : bool
+        Split capacity and conflict misses with a fully associative LRU shadow cache ,
+        off by default : the shadow costs every access an OrderedDict update and
+        access_batch a Python call per request , most of its numpy speedup.
+        Without it a non compulsory miss of a set associative cache is a conflict miss
+    block_size : int
+        Number of bytes moved from / to memory for a block
+    write_back, write_allocate : bool
+        Write policy of the cache , write back + write allocate by default
+    write_size : int
+        Number of bytes a write through (or a not allocated write) sends to memory
+    warmup_metrics, steady_metrics : cache_metric
+        With a warm-up , the counters of the warm-up references and of the ones
+        after it (metrics is one of the two) , None without
+    warmup_references : int
+        Number of references the warm-up took so far
 
     Methods
     -------
     access(str)
         Takes a hexadecimal string and process the request 
+
+    access_addr(int, int)
+        Process the request for an integer address and access type (1 = write),
+        returns the replacer status (1 hit, 0 filled, -1 evicted, -2 not allocated)
+
+    victim(int), invalidate(int), insert(int, int), lookup(int, int), write_block(int)
+        Block level operations used by CacheHierarchy
+
+    access_batch(addresses, ops)
+        Process a whole array of requests, vectorized for direct mapped caches
+
+    replay(binary_trace)
+        Process every request of a binary trace file
+
+    start_warmup(int, int, float)
+        Keeps the next references out of metrics (see warmup_replacer)
+
+    attach_log(event_log)
+        Starts recording per access events into the log
+
+    attach_stats(int), detach_stats()
+        Starts taking interval_stats rows every so many accesses , detaching
+        takes the row of the last (partial) interval and returns the stats
+
+    detach_log()
+        Stops recording events , the hot path is back to the plain replacer
     
-    hex_2_bin(str)
-        Converts a hexadecimal string to binary
+    hex_2_int(str)
+        Converts a hexadecimal string to an integer address
     """
-    def __init__(self, associativity, replacement_policy, cache_size, block_size):
+    def __init__(self, associativity, replacement_policy, cache_size, block_size, exact_3c = False,
+                 write_back = True, write_allocate = True, write_size = 4):
         #parameters associated with the cache
         self.num_blocks = cache_size // block_size
+        self.block_size = block_size
+        self.exact_3c = exact_3c
+        self.write_back = write_back
+        self.write_allocate = write_allocate
+        self.write_size = write_size
 
         self.enum_blocks = int(math.log2(self.num_blocks))
         self.eblock_size = int(math.log2(block_size))
@@ -134,28 +348,211 @@ class Cache:
          
         self.replacer = replacer(self, replacement_policy)
 
+        self.warmup_metrics = None
+        self.steady_metrics = None
+        self.warmup_references = 0
+
     
     def access(self, string, access):
 
-        addr = self.hex_2_bin(string)
+        addr = self.hex_2_int(string)
         
 
         if(access == 'w'):access_type = 1
         else:access_type = 0
-        
-        self.metrics.update('cache_access')
-        if( access_type == 0):
-            self.metrics.update('read_access')
-        if( access_type == 1):
-            self.metrics.update('write_access')
-        #core comparator
-        self.bbox(addr, access_type)
+
+        self.access_addr(addr, access_type)
+
+    def access_addr(self, addr, access_type):
+        #core comparator , the replacer counts the access
+        return self.bbox(addr, access_type)
+
+    def victim(self, addr):
+        """
+        returns (address, dirty_bit) of the block last evicted from the set of addr
+        """
+        bbox = self.bbox
+        victim = (bbox.blocks.evicted_tag << bbox.tag_shift) | (bbox.set_num(addr) << bbox.set_shift)
+        return victim, bbox.blocks.evicted_dirty
+
+    def invalidate(self, addr):
+        """
+        Removes the block of addr , returns its dirty bit (None if it was not cached)
+        """
+        set_num = self.bbox.set_num(addr)
+        blocks = self.bbox.blocks
+        way = blocks.lookup(self.bbox.tag(addr), set_num)
+        if( way == -1 ): return None
+        dirty = blocks.dirty_bits[set_num * blocks.ways + way]
+        blocks.invalidate(set_num, way)
+        self.replacer.policy.invalidate(blocks, way, set_num)
+        return dirty
+
+    def insert(self, addr, dirty):
+        """
+        Places the block of addr without counting an access (victims moving between levels)
+
+        returns 1 if the block was already cached , else the replacer status (0 or -1)
+        """
+        set_num = self.bbox.set_num(addr)
+        blocks = self.bbox.blocks
+        tag = self.bbox.tag(addr)
+        way = blocks.lookup(tag, set_num)
+        if( way != -1 ):
+            blocks.dirty_bits[set_num * blocks.ways + way] |= dirty
+            return 1
+        policy = self.replacer.policy
+        hit_status = policy.empty_block(tag, blocks, -1, dirty, set_num)
+        if( hit_status == -1 ): policy.evict(dirty, tag, blocks, hit_status, set_num)
+        return hit_status
+
+    def write_block(self, addr):
+        """
+        Writes the whole block of addr (a write back from the level above) : it
+        is counted as a write and a miss installs it without reading it first
+
+        returns the replacer status (1 hit, 0 filled, -1 evicted, -2 not allocated)
+        """
+        bbox = self.bbox
+        dirty = 1 if self.write_back else 0
+        if( self.lookup(addr, 1) ):
+            #a hit dirties the block and makes it the most recently used
+            self.replacer.policy.tag_check(bbox.tag(addr), bbox.blocks, dirty, bbox.set_num(addr))
+            return 1
+        if( not self.write_allocate ): return -2
+        return self.insert(addr, dirty)
+
+    def lookup(self, addr, access_type):
+        """
+        Counts an access for addr without changing what is cached , returns True on a hit
+        """
+        replacer = self.replacer
+        shadow_hit = replacer.shadow.access(addr >> self.eblock_size) if replacer.shadow is not None else None
+        if( self.bbox.blocks.lookup(self.bbox.tag(addr), self.bbox.set_num(addr)) != -1 ):
+            self.metrics.update(HIT_COUNTERS[access_type])
+            return True
+        self.metrics.update(MISS_COUNTERS[access_type][miss_kind(replacer, addr, shadow_hit)])
+        return False
+
+    def access_batch(self, addresses, ops):
+        """
+        Parameters
+        ----------
+        addresses : array of int
+            Integer addresses of the requests, in trace order
+        ops : array of str or int
+            'r'/'w' for every request, or 0/1 with 1 meaning write
+
+        Direct mapped write back / write allocate caches are simulated with numpy
+        array operations, any other configuration (or a missing numpy , an
+        event log , a warm-up or interval stats) falls back to access_addr.
+        """
+        if( np is None or self.bbox.associativity != 1 or type(self.replacer) is not replacer or self.replacer.stats is not None
+            or not (self.write_back and self.write_allocate) ):
+            if( hasattr(addresses, 'tolist') ): addresses = addresses.tolist()
+            if( hasattr(ops, 'tolist') ): ops = ops.tolist()
+            for addr, op in zip(addresses, ops):
+                if( isinstance(op, str) ): op = 1 if op == 'w' else 0
+                self.access_addr(int(addr), int(op))
+            return
+
+        addresses = np.asarray(addresses, dtype = np.int64)
+        ops = np.asarray(ops)
+        if( ops.dtype.kind in 'USO' ): writes = (ops == 'w')
+        else: writes = ops.astype(bool)
+        direct_mapped_batch(self, addresses, writes)
+
+    def replay(self, trace, chunk_size = 1 << 20):
+        """
+        Parameters
+        ----------
+        trace : binary_trace or str
+            A binary trace (or the path of one) written by write_binary_trace
+
+        The requests are read straight out of the memory mapped file, the
+        cache uses its own configuration and not the one in the trace header.
+        """
+        if( isinstance(trace, str) ): trace = binary_trace(trace)
+
+        records = trace.records()
+        if( records is None ):
+            for chunk in trace:
+                for addr, access_type in chunk:
+                    self.access_addr(addr, access_type)
+            return
+
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            self.access_batch(chunk['addr'], chunk['op'])
+
+    def attach_log(self, log):
+        if( log.level == LOG_OFF ): return
+        self.detach_log()
+        self.replacer = event_replacer(self.replacer, log)
+
+    def start_warmup(self, references = None, window = None, tolerance = 0.01):
+        """
+        Parameters
+        ----------
+        references : int
+            Length of the warm-up , or its upper bound when window is given
+        window : int
+            Detect the end of the warm-up : it is over after the first window
+            of that many references whose miss rate is within tolerance of
+            the one of the window before
+
+        The warm-up references update the cache and replacement state but are
+        counted in warmup_metrics , metrics goes back to steady_metrics after.
+        """
+        if( references is None and window is None ):
+            raise ValueError("a warm-up needs a number of references or a window")
+        if( self.warmup_metrics is not None ):
+            raise ValueError("the cache already has a warm-up")
+        if( window is None and references <= 0 ): return
+
+        self.steady_metrics = self.metrics
+        self.warmup_metrics = self.metrics = cache_metric(self.bbox.associativity, 0)
+        self.replacer = warmup_replacer(self, self.replacer, references, window, tolerance)
+
+    def base_replacer(self):
+        #the replacer under any event log / warm-up stand in
+        core = self.replacer
+        while( not isinstance(core, replacer) ): core = core.replacer
+        return core
+
+    def attach_stats(self, every):
+        self.detach_stats()
+        stats = interval_stats(every, self.bbox.num_sets)
+        self.base_replacer().stats = stats
+        return stats
+
+    def detach_stats(self):
+        core = self.base_replacer()
+        stats = core.stats
+        if( stats is None ): return None
+        if( stats.left != stats.every ): stats.snapshot(self)
+        core.stats = None
+        return stats
+
+    def detach_log(self):
+        #the log may sit under a warm-up stand in , it is unlinked wherever it is
+        holder = self
+        while( not isinstance(holder.replacer, replacer) ):
+            if( isinstance(holder.replacer, event_replacer) ):
+                holder.replacer = holder.replacer.replacer
+                return
+            holder = holder.replacer
 
     @staticmethod
-    def hex_2_bin(string):
-        return (bin(int(string, 16))[2:]).zfill(32)
+    def hex_2_int(string):
+        return int(string, 16)
     
     def out(self):
+        if( self.warmup_metrics is not None ):
+            print("Warm-up (", self.warmup_references, "references ) :")
+            self.warmup_metrics.print_metrics()
+            print("Steady state :")
+            return self.steady_metrics.print_metrics()
         return self.metrics.print_metrics()
 ###############################################################################################
 
@@ -174,12 +571,21 @@ class bbox:
     enum_sets:int
         log of number of sets
     
-    sets:List
-        List of cache_set objects each representing a set
+    blocks:cache_blocks
+        Every block of the cache , set by set
 
-    tag_bits:int
+    tagbits:int
         Number of binary digits in tag 
 
+    tag_shift:int
+        Right shift that drops the offset and index bits of an address
+
+    set_shift:int
+        Right shift that drops the offset bits of an address
+
+    set_mask:int
+        Mask selecting the index bits once the offset is shifted out
+
     Methods
     -------
     block_num(addr)
@@ -199,21 +605,23 @@ class bbox:
         self.ways = self.cache.num_blocks if self.associativity == 0 else self.associativity
         self.num_sets = self.cache.num_blocks // self.ways
         self.enum_sets = int(math.log2(self.num_sets))
-        self.sets = [cache_set(self.ways) for i in range(self.num_sets)]
+        self.blocks = cache_blocks(self.num_sets, self.ways)
         self.tagbits = int((32 - self.enum_sets - self.cache.eblock_size))
+
+        #address layout : | tag | index | offset |
+        self.set_shift = self.cache.eblock_size
+        self.set_mask = self.num_sets - 1
+        self.tag_shift = self.cache.eblock_size + self.enum_sets
         
     def __call__(self, addr, access_type):
-        cache_set = self.sets[self.set_num(addr)]
         #checking whether Hit or miss ,if miss => what to replace
-        self.cache.replacer(addr, access_type, self.tag(addr), cache_set, self.set_num(addr))         
+        return self.cache.replacer(addr, access_type, addr >> self.tag_shift, self.blocks, (addr >> self.set_shift) & self.set_mask)         
     
     def tag(self, addr):
-        return addr[0:(self.tagbits)]
+        return addr >> self.tag_shift
     
     def set_num(self, addr):
-
-        if( self.enum_sets == 0): return 0
-        return int(addr[(self.tagbits):(self.tagbits) + (self.enum_sets)], 2)
+        return (addr >> self.set_shift) & self.set_mask
 
 ##########################################################################################################
     
@@ -225,38 +633,81 @@ class replacer:
     ----------
     policy:obj
         Object to deal with replacement policy
+
+    first_touch:first_touch
+        Blocks touched so far, for compulsory misses
+
+    shadow:shadow_cache
+        Fully associative LRU cache of the same size, None unless cache.exact_3c
+
+    write_back:bool
+        Writes only dirty the block (True) or also go straight to memory (False)
+
+    write_allocate:bool
+        A write miss brings the block into the cache (True) or only goes to memory (False)
+
+    stats:interval_stats
+        Time series the requests are counted in , None unless attached
     
     Methods
     -------
     _call_(*args, **kwargs)
         Executes the address replacment protocol in a set designated by cache_core
+        returns 1 on a hit, 0 if an empty block was filled, -1 on an eviction
+        and -2 for a write miss that was not allocated
     """
     def __init__(self, cache, replacement_policy):
-        self.old_address = dict()
         self.cache = cache
+        self.first_touch = first_touch(cache.eblock_size)
+        self.shadow = shadow_cache(cache.num_blocks) if cache.exact_3c else None
+        self.write_back = cache.write_back
+        self.write_allocate = cache.write_allocate
+        self.stats = None
         if( replacement_policy == 0):       self.policy = random_policy(self)
         elif( replacement_policy == 1):     self.policy = lru_policy(self)
         else:                               self.policy = pseudo_policy(self)
             
         
-    def __call__(self, addr, access_type, tag,  cache_set ,set_num):
+    def __call__(self, addr, access_type, tag,  blocks ,set_num):
 
 
-        hit_status = self.policy.tag_check(tag, cache_set, access_type,set_num)
-            
-        if( hit_status != 1 ):  
-            cache_miss_update(self, access_type)
-            
-            if(addr not in self.old_address): 
-                self.cache.metrics.update('compulsory_miss')
-                self.old_address[addr] = 1
-            else: capacity_conflict_update(self)
+        metrics = self.cache.metrics
+        #a write that is not allocated leaves the cache (and the shadow cache) alone
+        allocate = self.write_allocate or access_type == 0
+        #write through caches never hold dirty blocks
+        dirty = access_type if self.write_back else 0
+
+        #the shadow cache sees every request , hit or miss
+        shadow_hit = self.shadow.access(addr >> self.cache.eblock_size, allocate) if self.shadow is not None else None
 
-            hit_status = self.policy.empty_block(tag, cache_set, hit_status, access_type,set_num)
+        #a row holds the requests before this one
+        stats = self.stats
+        if( stats is not None ):
+            if( stats.left == 0 ): stats.snapshot(self.cache)
+            stats.left -= 1
+
+        hit_status = self.policy.tag_check(tag, blocks, dirty,set_num)
+            
+        if( hit_status == 1 ):
+            metrics.update(HIT_COUNTERS[access_type])
+        else:  
+            metrics.update(MISS_COUNTERS[access_type][miss_kind(self, addr, shadow_hit)])
+            if( stats is not None ): stats.set_misses[set_num] += 1
+
+            if( not allocate ):
+                metrics.counts[WRITE_THROUGH_BYTES] += self.cache.write_size
+                return -2
+            metrics.counts[MEMORY_READ_BYTES] += self.cache.block_size
+
+            hit_status = self.policy.empty_block(tag, blocks, hit_status, dirty,set_num)
         
+        if( dirty != access_type ): metrics.counts[WRITE_THROUGH_BYTES] += self.cache.write_size
+
         # capacity miss
         if( hit_status == -1): 
-            self.policy.evict(access_type, tag, cache_set , hit_status,set_num)
+            self.policy.evict(dirty, tag, blocks , hit_status,set_num)
+
+        return hit_status
        
 #########################################################################################################
 class random_policy:
@@ -267,150 +718,97 @@ class random_policy:
     def __init__(self , replacer):
         self.cache = replacer.cache
 
-    def tag_check(self, tag, cache_set, access_type,set_num):
+    def tag_check(self, tag, blocks, access_type,set_num):
         """
-        Traverse through the set and check for the tag
+        Look up the tag in the set
         """
-        curr = cache_set.head
-        while( curr != None and curr.tag != tag):   curr = curr.next
-
-        if( curr!= None and curr.tag == tag ):
-            curr.dirty_bit = access_type
+        way = blocks.lookup(tag, set_num)
+        if( way != -1 ):
+            #a write hit dirties the block , a read hit leaves it as it is
+            if( access_type ): blocks.dirty_bits[set_num * blocks.ways + way] = 1
             return 1
         return -1
 
-    def empty_block(self, tag, cache_set, hit_status, access_type,set_num):
+    def empty_block(self, tag, blocks, hit_status, access_type,set_num):
         """
-        Traverse through the set and replace it if there is a empty block in the set
+        Replace the first empty block in the set, if there is one
         """
-        curr = cache_set.head
-        while( curr != None and curr.valid_bit != False):
-            curr   = curr.next
-        
-        if( curr != None and curr.valid_bit == False ):
-            curr.tag = tag
-            curr.valid_bit = 1
-            curr.dirty_bit = access_type
-            
+        way = blocks.empty_way(set_num)
+        if( way != -1 ):
+            blocks.fill(set_num, way, tag, access_type)
             return 0
         return hit_status
 
-    def evict(self, access_type, tag, cache_set , hit_status,set_num):
+    def invalidate(self, blocks, way, set_num):
+        pass
+
+    def evict(self, access_type, tag, blocks , hit_status,set_num):
         """
         Select a random block and evict the block
         """
-        randomizer = random.randint(0, self.cache.bbox.ways-1)
-        
-        curr = cache_set.head
-        randomizer = randomizer - 1
-        while( randomizer >= 0):
-            curr = curr.next
-            randomizer = randomizer -1
-        if( curr.dirty_bit == True): self.cache.metrics.update('dirty_evicted')
+        way = random.randint(0, blocks.ways-1)
+        if( blocks.dirty_bits[set_num * blocks.ways + way] ): dirty_evict_update(self.cache)
 
-        curr.tag = tag
-        curr.valid_bit = 1
-        curr.dirty_bit = access_type
+        blocks.fill(set_num, way, tag, access_type)
 
 #####################################################################################################
-#Pseudo LRU Policy 
+#LRU Policy 
 class lru_policy:
+    """
+    Class to deal with the LRU policy
+
+    Every set keeps an OrderedDict of its valid ways ordered from least to
+    most recently used, so hits, fills and evictions are all O(1). A one way
+    set has nothing to order (its way is always the victim) , order is None.
+    """
     def __init__(self, replacer):
         self.cache = replacer.cache
+        bbox = self.cache.bbox
+        self.order = [OrderedDict() for i in range(bbox.num_sets)] if bbox.ways > 1 else None
 
     #Checking Tag in cache
-    def tag_check(self,tag, cache_set, access_type ,set_num):
-        #Head of current set 
-        curr = cache_set.head
-        #Invalid case
-        if(curr == None):print("Error : No Data !") ; exit(0)
-
-        #If required Block present already as head of set
-        if(curr.tag == tag): return 1
-
-        #Iterating over set to find corresponding tag block
-        #if found , we move that block to head.
-        while(curr.next != None):
-            if(curr.next.tag == tag):
-                newHead = curr.next
-                curr.next = newHead.next
-
-                #moving hit block to head of set
-                newHead.next = cache_set.head
-                cache_set.head = newHead
-                return 1
-            curr = curr.next
-
+    def tag_check(self,tag, blocks, access_type ,set_num):
+        way = blocks.lookup(tag, set_num)
         #if not found    
-        return -1
-
-    def empty_block(self,tag, cache_set, hit_status, access_type,set_num):
-        curr = cache_set.head
-
-        #invalid case
-        if(curr == None):print("Error : no data "); exit(0)
-
-        #if invalid block is at start itself
-        if(curr.valid_bit == 0): 
-            curr(tag, 1, access_type)
-            
-            return 0
+        if( way == -1 ): return -1
 
-        #iterating for invalid block
-        #if found , we keep current block into that first invalid block in set
-        #and we move it to head of set
-        while(curr.next != None):
-            if(curr.next.valid_bit == 0):
-                newHead = curr.next
-                curr.next = newHead.next
+        #if found , it becomes the most recently used way (dirty after a write)
+        if( access_type ): blocks.dirty_bits[set_num * blocks.ways + way] = 1
+        if( self.order is not None ): self.order[set_num].move_to_end(way)
+        return 1
 
-                #moving first invalid block to head
-                newHead.next = cache_set.head
-                cache_set.head = newHead
-
-                #keeping current block to first invalid block(the head)
-                cache_set.head(tag, 1, access_type)
-
-                return 0
-
-            curr = curr.next
+    def empty_block(self,tag, blocks, hit_status, access_type,set_num):
+        way = blocks.empty_way(set_num)
 
         #If no invalid block present
-        return -1
+        if( way == -1 ): return -1
 
-    def evict(self,access_type, tag, cache_set , hit_status,set_num):
-        curr = cache_set.head
+        #keeping current block in the first invalid block as the most recently used
+        blocks.fill(set_num, way, tag, access_type)
+        if( self.order is not None ): self.order[set_num][way] = None
+        return 0
 
-        #Invalid case
-        if(curr == None):print("data not there");exit(0)
+    def invalidate(self, blocks, way, set_num):
+        #an emptied way leaves the recency order
+        if( self.order is not None ): del self.order[set_num][way]
 
-        #if only one block in cache.
-        if(curr.next == None):
-            if(curr.dirty_bit == 1):
-                self.cache.metrics.update('dirty_evicted')
-            curr(tag, 1, access_type)
+    def evict(self,access_type, tag, blocks , hit_status,set_num):
+        if( self.order is None ):
+            if( blocks.dirty_bits[set_num] ): dirty_evict_update(self.cache)
+            blocks.fill(set_num, 0, tag, access_type)
             return
+        order = self.order[set_num]
 
-        #We need to go to tail of set for eviction .. the least recently accessed block will be there.
-        while(curr.next.next != None): curr = curr.next
-
-        #note : tail address is curr.next 
-        #if tail is dirty block, update it in metrics.
-        if(curr.next.dirty_bit == 1):
-            self.cache.metrics.update('dirty_evicted')
-
-        #Moving evictable block to head 
-        #and keeping it to head.
-        newHead = curr.next
-        curr.next = None
-
-        newHead.next = cache_set.head
-        cache_set.head = newHead
-
-        newHead(tag, 1, access_type)
-        
+        #the least recently accessed way is at the front of the set
+        way, _ = order.popitem(last = False)
 
+        #if evicted block is dirty, update it in metrics.
+        if( blocks.dirty_bits[set_num * blocks.ways + way] ):
+            dirty_evict_update(self.cache)
 
+        #keeping the new block in its place as the most recently used
+        blocks.fill(set_num, way, tag, access_type)
+        order[way] = None
 
 #############################################################################################################
 #Class that deals with pseudo lru policy
@@ -425,166 +823,1321 @@ class pseudo_policy:
         
     #Checking the tag in cache.
     #If present we update Pseudo LRU tree
-    def tag_check(self, tag, cache_set, access_type,set_num):
+    def tag_check(self, tag, blocks, access_type,set_num):
         """
         Check if the tag is present
         """
-        curr = cache_set.head
-        while( curr != None ):
-            if( curr.tag == tag ):
-                curr.dirty_bit = access_type
-                self.tree.update_tree( tag, 1, set_num )
-                return 1
-            
-            curr = curr.next
+        way = blocks.lookup(tag, set_num)
+        if( way != -1 ):
+            if( access_type ): blocks.dirty_bits[set_num * blocks.ways + way] = 1
+            self.tree.touch( set_num, way )
+            return 1
         return -1
 
-    def empty_block(self, tag, cache_set, hit_status, access_type,set_num):
+    def empty_block(self, tag, blocks, hit_status, access_type,set_num):
         """
         Check for the empty block, if it is presnt replace it
+
+        The way the tree points at is preferred when it is still empty
         """
-        curr = cache_set.head
-        while(curr != None ):
-            if( curr.valid_bit == 0):
-                curr(tag, 1, access_type)
-                
-                self.tree.update_tree(tag, 0, set_num)
+        way = blocks.empty_way(set_num)
+        if( way != -1 ):
+            victim = self.tree.victim(set_num)
+            if( not blocks.valid_bits[set_num * blocks.ways + victim] ): way = victim
+
+            blocks.fill(set_num, way, tag, access_type)
+            self.tree.touch(set_num, way)
 
-                return 0
-            curr = curr.next
+            return 0
         return hit_status
 
-    def evict(self,access_type, tag, cache_set , hit_status, set_num):
-        """
-        Update the tree
+    def invalidate(self, blocks, way, set_num):
+        #the tree keeps its bits , an empty way is filled before any eviction
+        pass
 
-        Evict from cache if it is required
+    def evict(self,access_type, tag, blocks , hit_status, set_num):
         """
-        evit_tag = self.tree.update_tree( tag, hit_status, set_num )
-        self.evict_tag_from_cache( evit_tag, tag,access_type, cache_set, hit_status)
-
-    def evict_tag_from_cache(self,evit_tag, tag,access_type, cache_set, hit_status):
-        curr = cache_set.head
-        
-        while( curr!= None and curr.tag != evit_tag): curr = curr.next
+        Evict the way the tree points at and update the tree
+        """
+        way = self.tree.victim(set_num)
 
-        if( curr.dirty_bit == True): self.cache.metrics.update('dirty_evicted')
+        if( blocks.dirty_bits[set_num * blocks.ways + way] ): dirty_evict_update(self.cache)
 
-        curr(tag, 1, access_type)
+        blocks.fill(set_num, way, tag, access_type)
+        self.tree.touch(set_num, way)
 
 #####################################################################################################
  #Pseudo LRU Implementation
 class Pseudo_LRU:
+    """
+    Tree Pseudo LRU state, packed into one integer per set
+
+    Bit i of a set's state is internal node i of the tree (root is node 0,
+    children of node i are 2i+1 and 2i+2), 0 pointing left and 1 right.
+    Leaf ways-1+w of the tree is way w of the set.
+
+    Attributes
+    ----------
+    state:List
+        (ways - 1) bit tree of each set
+
+    clear_mask:List
+        Per way, the bits of the nodes on the path from the root to the way
+
+    set_mask:List
+        Per way, the node values on that path that point away from the way
+    """
     def __init__(self, replacer, cache):
         self.ways = cache.bbox.ways
-        (rows, cols) = ( cache.bbox.num_sets, (2*cache.bbox.ways - 1) )
-
-        #Declaring Tree for Pseudo LRU
-        self.tree =  [[0 for i in range(cols)] for j in range(rows)]
+        self.state = [0 for i in range(cache.bbox.num_sets)]
+
+        #Precomputing for each way the path to it, so touching a way is one mask
+        self.clear_mask = [0 for i in range(self.ways)]
+        self.set_mask = [0 for i in range(self.ways)]
+        for way in range(self.ways):
+            pos = way + self.ways - 1
+            while( pos != 0 ):
+                d = (pos - 1)//2
+                self.clear_mask[way] |= 1 << d
+                #left child (odd) => point right , right child => point left
+                if( pos % 2 ): self.set_mask[way] |= 1 << d
+                pos = d
 
         self.cache = cache
         self.bbox = cache.bbox
 
-    def update_tree( self, tag, hit_status, set_num  ):
-        #if memory request is Miss
-        #We traverse Along root to leaf to find evictable block or invalid block. 
-        if( hit_status != 1):
-            pos= 0
-
-            #travelling along tree from root to leaf 
-            #And updating internal nodes (toggling)
-            while( pos < self.ways -1 ):
-                d = self.tree[set_num][pos]
-                self.tree[set_num][pos] ^= 1
-                pos = 2*pos + (d+1)
-
-            #Evictable block
-            ans = self.tree[set_num][pos]
-            #Inserting new tag into tree
-            self.tree[set_num][pos] = tag
-            
-            return ans
-        
-        #When memory request is Hit.
-        #We traversal from leaf, where current tag presents, to root.
-        #And toggle bit such a way that , it doesn't point to current sub-tree
+    def victim( self, set_num ):
+        """
+        Follows the tree from root to leaf and returns the way it points at
+        """
+        state = self.state[set_num]
         pos = 0
+        while( pos < self.ways - 1 ):
+            pos = 2*pos + 1 + ((state >> pos) & 1)
+        return pos - (self.ways - 1)
 
-        #Searching for leaf that has current tag
-        for i in range( self.ways - 1, 2*self.ways - 1):
-            if( self.tree[set_num][i] == tag ):
-                pos = i
-                break
+    def touch( self, set_num, way ):
+        """
+        Points every node on the path to the way away from it
+        """
+        self.state[set_num] = (self.state[set_num] & ~self.clear_mask[way]) | self.set_mask[way]
 
-        #Crawling from leaf to root.
-        while( pos != 0 ):
-            d = (pos - 1)//2
 
-            #logic to toggle internal nodes for not pointing to same current-sub tree.
-            self.tree[set_num][d] ^= ((pos %2) ^ self.tree[set_num][d])
+#####################################################################################################
+#Interval Statistics
+#Binary interval file layout (little endian) :
+#   header : magic, number of columns, number of rows, number of sets, length of the names
+#   names : the column names , comma separated
+#   columns : every column as rows int64 values , then the heatmap as rows x sets int64 values
+INTERVAL_MAGIC = b'CINT'
+INTERVAL_HEADER = struct.Struct('<4sIQII')
+
+class interval_stats:
+    """
+    Time series of a cache's counters , a row is taken every `every` accesses
+
+    Attributes
+    ----------
+    every : int
+        Number of accesses between two rows
+
+    columns : dict
+        'access' (accesses seen when the row was taken) and the running total
+        of every cache_metric counter (warm-up included) , one array('q') each ,
+        only appended to
 
-            pos = d
+    set_misses : array
+        Misses of every set since the last row
+
+    heatmap_rows : array
+        The set_misses of every row back to back (rows x num_sets)
+
+    Methods
+    -------
+    snapshot(cache)
+        appends a row with the current counters of the cache
+
+    rows()
+        returns the number of rows taken
+
+    heatmap()
+        returns the per set misses of every interval (rows x num_sets)
+
+    write_csv(f), write_heatmap_csv(f), write_binary(f)
+        write the rows as csv text or in the binary interval layout
+    """
+    def __init__(self, every, num_sets):
+        if( every < 1 ): raise ValueError("interval must be at least 1 access")
+        self.every = every
+        self.num_sets = num_sets
+        self.left = every
+        self.seen = 0
+        self.columns = {name : array('q') for name in ('access',) + METRIC_NAMES}
+        self.set_misses = array('q', [0]) * num_sets
+        self.zeros = array('q', [0]) * num_sets
+        self.heatmap_rows = array('q')
+
+    def snapshot(self, cache):
+        self.seen += self.every - self.left
+        self.left = self.every
+
+        columns = self.columns
+        columns['access'].append(self.seen)
+        if( cache.warmup_metrics is None ):
+            for name, count in zip(METRIC_NAMES, cache.metrics.counts):
+                columns[name].append(count)
+        else:
+            #a warm-up counts apart from metrics , the totals run over both
+            for name, warmup, steady in zip(METRIC_NAMES, cache.warmup_metrics.counts, cache.steady_metrics.counts):
+                columns[name].append(warmup + steady)
+
+        self.heatmap_rows.extend(self.set_misses)
+        self.set_misses[:] = self.zeros
+
+    def rows(self):
+        return len(self.columns['access'])
+
+    def heatmap(self):
+        if( np is not None ):
+            return np.frombuffer(self.heatmap_rows, dtype = np.int64).reshape(self.rows(), self.num_sets)
+        return [self.heatmap_rows[i * self.num_sets:(i + 1) * self.num_sets] for i in range(self.rows())]
+
+    def write_csv(self, f):
+        names = list(self.columns)
+        f.write(",".join(names) + "\n")
+        for row in zip(*[self.columns[name] for name in names]):
+            f.write(",".join(map(str, row)) + "\n")
+
+    def write_heatmap_csv(self, f):
+        f.write("access," + ",".join("set" + str(i) for i in range(self.num_sets)) + "\n")
+        for i, access in enumerate(self.columns['access']):
+            row = self.heatmap_rows[i * self.num_sets:(i + 1) * self.num_sets]
+            f.write(str(access) + "," + ",".join(map(str, row)) + "\n")
+
+    def write_binary(self, f):
+        names = ",".join(self.columns).encode()
+        f.write(INTERVAL_HEADER.pack(INTERVAL_MAGIC, len(self.columns), self.rows(), self.num_sets, len(names)))
+        f.write(names)
+        for column in list(self.columns.values()) + [self.heatmap_rows]:
+            if( sys.byteorder == 'big' ):
+                column = array('q', column)
+                column.byteswap()
+            f.write(column.tobytes())
+
+def read_intervals(path):
+    """
+    Reads a file written by interval_stats.write_binary , returns
+    (columns, heatmap rows , num_sets) with every column an array('q')
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, num_columns, rows, num_sets, length = INTERVAL_HEADER.unpack_from(data)
+    if( magic != INTERVAL_MAGIC ): raise ValueError(path + " is not an interval file")
+
+    start = INTERVAL_HEADER.size + length
+    names = data[INTERVAL_HEADER.size:start].decode().split(",")
+    values = array('q')
+    values.frombytes(data[start:])
+    if( sys.byteorder == 'big' ): values.byteswap()
+
+    columns = {name : values[i * rows:(i + 1) * rows] for i, name in enumerate(names)}
+    return columns, values[num_columns * rows:], num_sets
+
+#####################################################################################################
+#Event Logging
+LOG_OFF = 0         #nothing is recorded
+LOG_MISSES = 1      #only misses are recorded
+LOG_ALL = 2         #hits and misses are recorded
+
+class event_log:
+    """
+    A buffered stream of per access events
+
+    Every event is (index, address, access_type, set_num, tag, status) where
+    index counts the accesses seen by the cache and status is the value
+    returned by the replacer (1 hit, 0 filled an empty block, -1 evicted).
+
+    Attributes
+    ----------
+    f : file
+        Sink for the events, opened in text mode for csv and binary mode for binary
+
+    level : int
+        LOG_OFF, LOG_MISSES or LOG_ALL
+
+    sample : int
+        Only one access out of every sample accesses is considered for logging
+
+    fmt : str
+        'csv' or 'binary' (little endian records laid out as EVENT)
+
+    buffer_size : int
+        Number of events held in memory before they are written to the sink
+    """
+    EVENT = struct.Struct('<QQBIQb')
+
+    def __init__(self, f, level = LOG_ALL, sample = 1, fmt = 'csv', buffer_size = 4096):
+        if( fmt not in ('csv', 'binary') ): raise ValueError("unknown event log format " + str(fmt))
+        self.f = f
+        self.level = level
+        self.sample = max(1, sample)
+        self.fmt = fmt
+        self.buffer_size = buffer_size
+        self.buffer = []
+        if( fmt == 'csv' ): f.write("index,address,access_type,set_num,tag,status\n")
+
+    def record(self, index, addr, access_type, set_num, tag, status):
+        self.buffer.append((index, addr, access_type, set_num, tag, status))
+        if( len(self.buffer) >= self.buffer_size ): self.flush()
+
+    def flush(self):
+        if( self.fmt == 'csv' ):
+            self.f.write("".join(["%d,0x%x,%d,%d,%d,%d\n" % event for event in self.buffer]))
+        else:
+            self.f.write(b"".join([self.EVENT.pack(*event) for event in self.buffer]))
+        self.buffer = []
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+
+class event_replacer:
+    """
+    Stands in for a replacer while an event_log is attached to the cache
+
+    Detached caches call the replacer directly , so logging costs nothing
+    unless it is switched on.
+    """
+    def __init__(self, replacer, log):
+        self.replacer = replacer
+        self.log = log
+        self.index = 0
+
+    def __getattr__(self, name):
+        #only asked for what this object lacks , while unpickling that is replacer itself
+        if( name == 'replacer' or name.startswith('__') ): raise AttributeError(name)
+        return getattr(self.replacer, name)
+
+    def __call__(self, addr, access_type, tag, blocks, set_num):
+        hit_status = self.replacer(addr, access_type, tag, blocks, set_num)
+
+        log = self.log
+        if( self.index % log.sample == 0 and (hit_status != 1 or log.level == LOG_ALL) ):
+            log.record(self.index, addr, access_type, set_num, tag, hit_status)
+        self.index += 1
+        return hit_status
+
+
+class warmup_replacer:
+    """
+    Stands in for a replacer while the cache warms up (see Cache.start_warmup)
+
+    It counts the references and , once the warm-up is over , points the cache
+    back to the steady state metrics and to the replacer itself.
+
+    Attributes
+    ----------
+    left : int
+        References the warm-up may still take (None for no bound)
+    window, tolerance :
+        Sliding window of the detection , None for a fixed warm-up
+    accesses, misses : int
+        References and misses of the current window
+    last_rate : float
+        Miss rate of the window before , None for the first one
+    """
+    def __init__(self, cache, replacer, references, window, tolerance):
+        self.cache = cache
+        self.replacer = replacer
+        self.left = references
+        self.window = window
+        self.tolerance = tolerance
+        self.accesses = 0
+        self.misses = 0
+        self.last_rate = None
+        self.done = False
+
+    def __getattr__(self, name):
+        #only asked for what this object lacks , while unpickling that is replacer itself
+        if( name == 'replacer' or name.startswith('__') ): raise AttributeError(name)
+        return getattr(self.replacer, name)
+
+    def __call__(self, addr, access_type, tag, blocks, set_num):
+        hit_status = self.replacer(addr, access_type, tag, blocks, set_num)
+        if( self.done ): return hit_status
+
+        self.cache.warmup_references += 1
+        if( self.left is not None ):
+            self.left -= 1
+            if( self.left <= 0 ): self.finish()
+
+        if( self.window is not None and not self.done ):
+            self.accesses += 1
+            if( hit_status != 1 ): self.misses += 1
+            if( self.accesses == self.window ):
+                rate = self.misses / self.window
+                if( self.last_rate is not None and abs(rate - self.last_rate) <= self.tolerance ):
+                    self.finish()
+                self.last_rate = rate
+                self.accesses = self.misses = 0
+        return hit_status
+
+    def finish(self):
+        self.done = True
+        cache = self.cache
+        cache.metrics = cache.steady_metrics
+        #an event log attached during the warm-up wraps this proxy , it then stays as a pass through
+        if( cache.replacer is self ): cache.replacer = self.replacer
 
 
 #######################################################################################################
 
-def cache_miss_update(replacer, access_type):
+def dirty_evict_update(cache):
     """
-    update the metrics if there is a cache miss
+    update the metrics when a dirty block is written back to memory
     """
-    replacer.cache.metrics.update('cache_miss')
-    if( access_type == 0):
-        replacer.cache.metrics.update('read_miss')
-    else:
-        replacer.cache.metrics.update('write_miss')
+    counts = cache.metrics.counts
+    counts[DIRTY_EVICTED] += 1
+    counts[WRITEBACK_BYTES] += cache.block_size
 
-def capacity_conflict_update(replacer):
+def miss_kind(replacer, addr, shadow_hit = None):
     """
-    update the metrics if there is a conflict or capacity miss
+    returns the metric of a miss : compulsory_miss, capacity_miss or conflict_miss
+
+    With a shadow cache a miss is a capacity miss when the fully associative
+    LRU cache of the same size misses too, and a conflict miss when it hits.
     """
-    if( replacer.cache.bbox.associativity == 0): replacer.cache.metrics.update('capacity_misses')
+    if( replacer.first_touch.touch(addr >> replacer.cache.eblock_size) ): return 'compulsory_miss'
+    if( shadow_hit is not None ): return 'conflict_miss' if shadow_hit else 'capacity_miss'
     ##Even in non-fully associative caches , if it is capacity miss ,it wont count for conflict misses.
-    else:replacer.cache.metrics.update('conflict_miss')
+    if( replacer.cache.bbox.associativity == 0): return 'capacity_miss'
+    return 'conflict_miss'
+
+class shadow_cache:
+    """
+    A fully associative LRU cache of blocks, run next to the real cache for 3C classification
+
+    Attributes
+    ----------
+    num_blocks:int
+        Capacity in blocks
+
+    blocks:OrderedDict
+        Cached blocks from least to most recently used
+
+    Methods
+    -------
+    access(int, bool)
+        Looks up the block and installs it on a miss if allocate , returns True on a hit
+    """
+    def __init__(self, num_blocks):
+        self.num_blocks = num_blocks
+        self.blocks = OrderedDict()
+
+    def access(self, block, allocate = True):
+        blocks = self.blocks
+        if( block in blocks ):
+            blocks.move_to_end(block)
+            return True
+        if( not allocate ): return False
+        blocks[block] = None
+        if( len(blocks) > self.num_blocks ): blocks.popitem(last = False)
+        return False
+
+
+def direct_mapped_batch(cache, addresses, writes):
+    """
+    Simulates a batch of requests on a direct mapped cache with numpy
+
+    With one way per set a request hits exactly when the previous request to
+    its set (or the block already in the set) has the same tag, so the trace
+    is stably sorted by set and every tag is compared with its predecessor.
+    The block being replaced is dirty when any request since it was filled
+    (the filling miss included) was a write , or it was already dirty before
+    the batch and was never replaced.
+    """
+    n = len(addresses)
+    if( n == 0 ): return
+    bbox = cache.bbox
+    cache_blocks = bbox.blocks
+    metrics = cache.metrics
+    writes = writes.astype(np.int8)
+
+    set_nums = (addresses >> bbox.set_shift) & bbox.set_mask
+    tags = addresses >> bbox.tag_shift
+
+    #state of every set before the batch , views of the cache wide arrays (slot i is set i)
+    init_tag = np.frombuffer(cache_blocks.tags, dtype = np.int64)
+    init_valid = np.frombuffer(cache_blocks.valid_bits, dtype = np.int8)
+    init_dirty = np.frombuffer(cache_blocks.dirty_bits, dtype = np.int8)
+
+    #grouping requests by set, keeping trace order inside a set
+    order = np.argsort(set_nums, kind = 'stable')
+    s_set = set_nums[order]
+    s_tag = tags[order]
+    s_write = writes[order]
+    s_addr = addresses[order]
+
+    first = np.ones(n, dtype = bool)
+    first[1:] = s_set[1:] != s_set[:-1]
+    idx = np.arange(n)
+    seg_start = np.maximum.accumulate(np.where(first, idx, 0))
+
+    #tag and validity of the block each request finds in its set
+    prev_tag = np.empty(n, dtype = np.int64)
+    prev_tag[1:] = s_tag[:-1]
+    prev_tag[first] = init_tag[s_set[first]]
+    prev_valid = np.ones(n, dtype = bool)
+    prev_valid[first] = init_valid[s_set[first]] == 1
+
+    hit = prev_valid & (prev_tag == s_tag)
+    miss = ~hit
+
+    #dirty bit of the block each request finds in its set : the writes since
+    #the miss that filled it , counted with a running sum of the writes
+    last_fill = np.maximum.accumulate(np.where(miss, idx, -1))
+    filler = np.full(n, -1)
+    filler[1:] = last_fill[:-1]
+    from_init = filler < seg_start
+    written = np.concatenate(([0], np.cumsum(s_write, dtype = np.int64)))
+    writes_since = written[idx] - written[np.where(from_init, seg_start, filler)]
+    prev_dirty = np.where(from_init, init_dirty[s_set] | (writes_since > 0), writes_since > 0).astype(np.int8)
+
+    num_miss = int(miss.sum())
+    num_write = int(s_write.sum())
+    write_miss = int((s_write[miss]).sum())
+    dirty_evicted = int((miss & prev_valid & (prev_dirty == 1)).sum())
+
+    #compulsory misses : blocks missing for the first time
+    compulsory = cache.replacer.first_touch.touch_many(np.unique(s_addr[miss] >> cache.eblock_size).tolist())
+
+    #capacity misses : the shadow cache runs over the batch in trace order ,
+    #every compulsory miss is also a shadow miss. This loop is Python , one
+    #call per request , so only blocks that differ from the request before
+    #go through it (a repeat is a hit on the most recently used block)
+    shadow = cache.replacer.shadow
+    if( shadow is not None ):
+        access = shadow.access
+        block_nums = addresses >> cache.eblock_size
+        new_block = np.ones(n, dtype = bool)
+        new_block[1:] = block_nums[1:] != block_nums[:-1]
+        shadow_miss = np.zeros(n, dtype = bool)
+        shadow_miss[new_block] = np.fromiter((not access(block) for block in block_nums[new_block].tolist()), dtype = bool, count = int(new_block.sum()))
+        capacity = int((shadow_miss[order] & miss).sum()) - compulsory
+    else:
+        capacity = 0
+
+    metrics.add('cache_access', n)
+    metrics.add('read_access', n - num_write)
+    metrics.add('write_access', num_write)
+    metrics.add('cache_miss', num_miss)
+    metrics.add('read_miss', num_miss - write_miss)
+    metrics.add('write_miss', write_miss)
+    metrics.add('compulsory_miss', compulsory)
+    metrics.add('capacity_miss', capacity)
+    metrics.add('conflict_miss', num_miss - compulsory - capacity)
+    metrics.add('dirty_evicted', dirty_evicted)
+    metrics.add('memory_read_bytes', num_miss * cache.block_size)
+    metrics.add('writeback_bytes', dirty_evicted * cache.block_size)
+
+    #writing back the final block of every touched set , through the views
+    last = np.ones(n, dtype = bool)
+    last[:-1] = s_set[1:] != s_set[:-1]
+    final_dirty = np.where(miss, s_write, prev_dirty | s_write)
+    final_sets = s_set[last]
+    init_tag[final_sets] = s_tag[last]
+    init_valid[final_sets] = 1
+    init_dirty[final_sets] = final_dirty[last]
+
+
+##########################################  Trace Reading  ###############################################################
+class trace_reader:
+    """
+    Streams an input file : the four header lines, then the memory requests
+
+    Anything after a '#' on a line is a comment, blank lines are skipped and
+    so is any other line that is not an "<hex address> <r|w>" request.
+
+    Attributes
+    ----------
+    cache_size, block_size, associativity, replacement_policy : int
+        The header of the input file
+
+    chunk_size : int
+        Maximum number of requests yielded at a time
+
+    Methods
+    -------
+    __iter__()
+        Yields lists of (address, access_type) tuples, access_type is 1 for writes
+    """
+    def __init__(self, f, chunk_size = 65536):
+        self.f = f
+        self.chunk_size = chunk_size
+
+        header = []
+        while( len(header) < 4 ):
+            line = f.readline()
+            if( line == '' ): raise ValueError("input file ended inside the header")
+            line = line.split('#', 1)[0].strip()
+            if( line != '' ): header.append(int(line))
+
+        self.cache_size, self.block_size, self.associativity, self.replacement_policy = header
+
+    def __iter__(self):
+        chunk = []
+        for line in self.f:
+            fields = line.split('#', 1)[0].split()
+            if( len(fields) < 2 or fields[1] not in ('r', 'w') ): continue
+            try: addr = int(fields[0], 16)
+            except ValueError: continue
+
+            chunk.append((addr, 1 if fields[1] == 'w' else 0))
+            if( len(chunk) == self.chunk_size ):
+                yield chunk
+                chunk = []
+        if( chunk ): yield chunk
+
+
+#########################################  Binary Traces  ###############################################################
+#Binary trace layout (little endian) :
+#   header : magic, cache size, block size, associativity, replacement policy, number of requests
+#   records : uint32 address, uint8 access type (1 = write), packed back to back
+TRACE_MAGIC = b'CTRC'
+TRACE_HEADER = struct.Struct('<4sIIIIQ')
+TRACE_RECORD = struct.Struct('<IB')
+
+def write_binary_trace(text_path, binary_path):
+    """
+    Converts a text input file into a binary trace, returns the number of requests
+    """
+    count = 0
+    with open(text_path, 'r') as src, open(binary_path, 'wb') as dst:
+        trace = trace_reader(src)
+        #count is filled in once all the requests are written
+        dst.write(TRACE_HEADER.pack(TRACE_MAGIC, trace.cache_size, trace.block_size, trace.associativity, trace.replacement_policy, 0))
+
+        for chunk in trace:
+            dst.write(b''.join([TRACE_RECORD.pack(addr, access_type) for addr, access_type in chunk]))
+            count += len(chunk)
+
+        dst.seek(0)
+        dst.write(TRACE_HEADER.pack(TRACE_MAGIC, trace.cache_size, trace.block_size, trace.associativity, trace.replacement_policy, count))
+    return count
+
+class binary_trace:
+    """
+    A binary trace file written by write_binary_trace
+
+    Attributes
+    ----------
+    path : str
+        Path of the trace file
+
+    cache_size, block_size, associativity, replacement_policy : int
+        The cache parameters stored in the header
+
+    count : int
+        Number of requests in the file
+
+    Methods
+    -------
+    records()
+        numpy memmap of the requests with fields 'addr' and 'op', None without numpy
+
+    __iter__()
+        Yields lists of (address, access_type) tuples read through mmap
+    """
+    def __init__(self, path, chunk_size = 65536):
+        self.path = path
+        self.chunk_size = chunk_size
+        with open(path, 'rb') as f:
+            header = f.read(TRACE_HEADER.size)
+        if( len(header) != TRACE_HEADER.size or header[:4] != TRACE_MAGIC ):
+            raise ValueError(path + " is not a binary trace")
+
+        _, self.cache_size, self.block_size, self.associativity, self.replacement_policy, self.count = TRACE_HEADER.unpack(header)
+
+    def records(self):
+        if( np is None ): return None
+        dtype = np.dtype([('addr', '<u4'), ('op', 'u1')])
+        if( self.count == 0 ): return np.zeros(0, dtype = dtype)
+        return np.memmap(self.path, dtype = dtype, mode = 'r', offset = TRACE_HEADER.size, shape = (self.count,))
+
+    def __iter__(self):
+        if( self.count == 0 ): return
+        with open(self.path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                step = self.chunk_size * TRACE_RECORD.size
+                end = TRACE_HEADER.size + self.count * TRACE_RECORD.size
+                for start in range(TRACE_HEADER.size, end, step):
+                    yield list(TRACE_RECORD.iter_unpack(buf[start:min(start + step, end)]))
+            finally:
+                buf.close()
+
+
+##########################################  LRU Sweep  ##################################################################
+def cache_shape(cache_size, block_size, associativity):
+    """
+    returns (num_sets, ways) of a cache, None for shapes the Cache class can not build
+    """
+    if( block_size < 1 or block_size & (block_size - 1) != 0 ): return None
+    num_blocks = cache_size // block_size
+    ways = num_blocks if associativity == 0 else associativity
+    if( ways < 1 or num_blocks % ways != 0 ): return None
+    num_sets = num_blocks // ways
+    if( num_sets & (num_sets - 1) != 0 or ways & (ways - 1) != 0 ): return None
+    return num_sets, ways
+
+class lru_sweep:
+    """
+    Simulates every LRU cache of one block size in a single pass (Mattson stack distances)
+
+    The caches are write back / write allocate , like the default Cache.
+
+    Caches with the same number of sets share one LRU stack per set. A request
+    found at depth d of its stack hits in every cache of that group with at
+    least d ways, so one stack update serves all of them. Stacks are cut at
+    the largest associativity of the group since deeper blocks miss everywhere.
+
+    Attributes
+    ----------
+    block_size:int
+        Block size shared by all the caches of the sweep
+
+    groups:List
+        One sweep_group per distinct number of sets
+
+    fa_stack:List
+        Fully associative LRU stack (the shadow cache of every size), None unless exact_3c ,
+        its depth walk makes a reference about 1.6 times as slow
+
+    Methods
+    -------
+    access_addr(int, int)
+        Process one request (access_type 1 = write) for every cache
+
+    results()
+        Returns {(cache_size, block_size, associativity) : cache_metric}
+    """
+    def __init__(self, block_size, cache_sizes, associativities, exact_3c = False):
+        self.block_size = block_size
+        self.eblock_size = int(math.log2(block_size))
+        #the first request to a block misses in every cache , the rest never are compulsory
+        self.first_touch = first_touch(self.eblock_size)
+
+        configs = dict()
+        for cache_size in cache_sizes:
+            for associativity in associativities:
+                shape = cache_shape(cache_size, block_size, associativity)
+                if( shape is None ): continue
+                num_sets, ways = shape
+                configs.setdefault(num_sets, []).append((ways, cache_size, associativity))
+
+        self.groups = [sweep_group(self, num_sets, configs[num_sets]) for num_sets in sorted(configs)]
+
+        self.fa_stack = [] if exact_3c else None
+        self.fa_depth = max([ways * num_sets for num_sets in configs for ways, _, _ in configs[num_sets]] + [0])
+
+    def access_addr(self, addr, access_type):
+        block = addr >> self.eblock_size
+        first = self.first_touch.touch(block)
+
+        #depth of the block in the fully associative stack , 0 when deeper than every cache
+        fa_stack = self.fa_stack
+        if( fa_stack is None ):
+            fa_depth = None
+        else:
+            try:
+                fa_depth = fa_stack.index(block) + 1
+                fa_stack.pop(fa_depth - 1)
+            except ValueError:
+                fa_depth = 0
+            fa_stack.insert(0, block)
+            if( len(fa_stack) > self.fa_depth ): fa_stack.pop()
+
+        for group in self.groups:
+            group(block, access_type, first, fa_depth)
+
+    def results(self):
+        table = dict()
+        for group in self.groups:
+            table.update(group.results())
+        return table
+
+class sweep_group:
+    """
+    The LRU stacks and counters of all swept caches with the same number of sets
+
+    Caches of the group are sorted by ways, bit i of every mask below stands
+    for the i-th cache. A request at depth d misses in the first k caches,
+    where k is the number of caches with fewer than d ways.
+
+    Attributes
+    ----------
+    stacks:dict
+        set number -> blocks of the set, most recently used first
+
+    dirty:dict
+        set number -> per block mask of the caches in which the block is dirty
+
+
+    reads, writes:List
+        Number of reads / writes that missed in exactly the first k caches
+
+    capacity:List
+        Per cache, misses that the fully associative LRU cache of its size misses too
+    """
+    def __init__(self, sweep, num_sets, configs):
+        self.sweep = sweep
+        self.num_sets = num_sets
+        self.set_mask = num_sets - 1
+        self.configs = sorted(configs)
+        self.ways = [ways for ways, _, _ in self.configs]
+        self.num_blocks = [ways * num_sets for ways in self.ways]
+        self.max_ways = self.ways[-1]
+
+        self.stacks = dict()
+        self.dirty = dict()
+
+        n = len(self.configs)
+        self.all_mask = (1 << n) - 1
+        self.reads = [0 for i in range(n + 1)]
+        self.writes = [0 for i in range(n + 1)]
+        self.dirty_evicted = [0 for i in range(n)]
+        self.capacity = [0 for i in range(n)]
+
+    def __call__(self, block, access_type, first, fa_depth):
+        set_num = block & self.set_mask
+        stack = self.stacks.get(set_num)
+        if( stack is None ):
+            stack = self.stacks[set_num] = []
+            self.dirty[set_num] = []
+        dirty = self.dirty[set_num]
+
+        try:
+            depth = stack.index(block) + 1
+            k = bisect.bisect_left(self.ways, depth)
+        except ValueError:
+            depth = 0
+            k = len(self.ways)
+
+        if( access_type ): self.writes[k] += 1
+        else: self.reads[k] += 1
+        if( k == 0 ):
+            #hit everywhere , the recency changes and a write dirties the block
+            if( depth != 1 ):
+                stack.insert(0, stack.pop(depth - 1))
+                dirty.insert(0, dirty.pop(depth - 1))
+            if( access_type ): dirty[0] = self.all_mask
+            return
+
+        miss_mask = (1 << k) - 1
+
+        #a (non compulsory) miss is a capacity miss when the shadow cache of the same size misses
+        if( fa_depth is not None and not first ):
+            for i in range(k):
+                if( fa_depth == 0 or fa_depth > self.num_blocks[i] ): self.capacity[i] += 1
+
+        #the block at depth ways is evicted from every missing cache whose set is full
+        for i in range(k):
+            ways = self.ways[i]
+            if( ways > len(stack) ): break
+            if( (dirty[ways - 1] >> i) & 1 ): self.dirty_evicted[i] += 1
+
+        #a write dirties the block in every cache , a read keeps the dirty
+        #bit where it hits and refills it clean where it misses
+        if( depth ):
+            stack.pop(depth - 1)
+            old = dirty.pop(depth - 1)
+        else:
+            old = 0
+        stack.insert(0, block)
+        dirty.insert(0, self.all_mask if access_type else old & ~miss_mask)
+        if( len(stack) > self.max_ways ):
+            stack.pop()
+            dirty.pop()
+
+    def results(self):
+        table = dict()
+        compulsory = self.sweep.first_touch.count
+        for i, (ways, cache_size, associativity) in enumerate(self.configs):
+            metrics = cache_metric(associativity, 1)
+            read_miss = sum(self.reads[i + 1:])
+            write_miss = sum(self.writes[i + 1:])
+            metrics.add('read_access', sum(self.reads))
+            metrics.add('write_access', sum(self.writes))
+            metrics.add('cache_access', metrics.read_access + metrics.write_access)
+            metrics.add('read_miss', read_miss)
+            metrics.add('write_miss', write_miss)
+            metrics.add('cache_miss', read_miss + write_miss)
+            metrics.add('compulsory_miss', compulsory)
+            if( self.sweep.fa_stack is not None ): capacity = self.capacity[i]
+            elif( associativity == 0 ): capacity = read_miss + write_miss - compulsory
+            else: capacity = 0
+            metrics.add('capacity_miss', capacity)
+            metrics.add('conflict_miss', read_miss + write_miss - compulsory - capacity)
+            metrics.add('dirty_evicted', self.dirty_evicted[i])
+            metrics.add('memory_read_bytes', (read_miss + write_miss) * self.sweep.block_size)
+            metrics.add('writeback_bytes', self.dirty_evicted[i] * self.sweep.block_size)
+            table[(cache_size, self.sweep.block_size, associativity)] = metrics
+        return table
+
+def sweep_lru(chunks, block_sizes, cache_sizes, associativities, exact_3c = False):
+    """
+    Runs an LRU sweep over every block size in one pass of the trace
+
+    Parameters
+    ----------
+    chunks : iterable
+        Lists of (address, access_type) tuples, e.g. a trace_reader or binary_trace
+
+    Returns {(cache_size, block_size, associativity) : cache_metric}
+    """
+    sweeps = [lru_sweep(block_size, cache_sizes, associativities, exact_3c) for block_size in block_sizes]
+    for chunk in chunks:
+        for sweep in sweeps:
+            access = sweep.access_addr
+            for addr, access_type in chunk:
+                access(addr, access_type)
+
+    table = dict()
+    for sweep in sweeps:
+        table.update(sweep.results())
+    return table
+
+def write_sweep_csv(table, f):
+    """
+    Writes a sweep table as csv, one row per cache configuration
+
+    Tables of sweep_parallel carry the replacement policy as a fourth key column
+    """
+    keys = ["cache_size", "block_size", "associativity", "replacement_policy"]
+    fields = None
+    for key in sorted(table):
+        metrics = table[key].as_dict()
+        if( fields is None ):
+            fields = list(metrics)
+            f.write(",".join(keys[:len(key)] + fields) + "\n")
+        f.write(",".join(str(v) for v in list(key) + [metrics[k] for k in fields]) + "\n")
+
+##########################################  Parallel Sweep  #############################################################
+def run_config(job):
+    """
+    Replays a binary trace on one cache configuration (a sweep_parallel worker)
+
+    job is (trace_path, cache_size, block_size, associativity, replacement_policy, seed)
+    """
+    trace_path, cache_size, block_size, associativity, replacement_policy, seed = job
+    #every configuration gets the same random stream , whichever worker runs it
+    random.seed(seed)
+    cache = Cache(associativity, replacement_policy, cache_size, block_size)
+    cache.replay(trace_path)
+    return (cache_size, block_size, associativity, replacement_policy), cache.metrics
+
+def sweep_parallel(trace_path, cache_sizes, block_sizes, associativities, replacement_policies, processes = None, seed = 0):
+    """
+    Simulates every cache configuration of the grid on a pool of processes
+
+    Each worker replays the same memory mapped binary trace, so the trace is
+    shared through the page cache instead of being copied to the workers.
+    A text input file is converted to a temporary binary trace first.
+
+    Returns {(cache_size, block_size, associativity, replacement_policy) : cache_metric}
+    """
+    with open(trace_path, 'rb') as f:
+        is_binary = f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+    temp_path = None
+    if( not is_binary ):
+        fd, temp_path = tempfile.mkstemp(suffix = '.trace')
+        os.close(fd)
+        write_binary_trace(trace_path, temp_path)
+        trace_path = temp_path
+
+    jobs = []
+    for block_size in block_sizes:
+        for cache_size in cache_sizes:
+            for associativity in associativities:
+                if( cache_shape(cache_size, block_size, associativity) is None ): continue
+                for replacement_policy in replacement_policies:
+                    jobs.append((trace_path, cache_size, block_size, associativity, replacement_policy, seed))
+
+    try:
+        pool = multiprocessing.Pool(processes)
+        try:
+            table = dict(pool.imap_unordered(run_config, jobs))
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        if( temp_path is not None ): os.remove(temp_path)
+    return table
+
+
+##########################################  Cache Hierarchy  ############################################################
+class CacheHierarchy:
+    """
+    A chain of Cache levels (L1 first) simulated in one pass over the trace
+
+    A miss at one level is a read of the block at the next level and a dirty
+    eviction is a write of the block to the next level ; the last level talks
+    to memory.
+
+    Modes
+    -----
+    non-inclusive : every level fills on a miss , evictions do not propagate upwards
+    inclusive     : like non-inclusive , and a block evicted from a level is
+                    invalidated in the levels above it (dirty copies are written back)
+    exclusive     : levels below L1 only hold blocks evicted from the level above ,
+                    a hit there moves the block up and out of the lower level
+                    (every level needs the same block size)
+
+    A dirty block written back to a level with blocks no larger than its own
+    is complete , a miss installs it there without reading it from below.
+
+    Attributes
+    ----------
+    levels : List
+        Cache objects , L1 first
+
+    latencies : List
+        Hit time of every level , in cycles
+
+    memory_latency : int
+        Time to fetch a block from memory , in cycles
+
+    demand_accesses, demand_misses : List
+        Per level , requests caused by the processor (write backs are not counted)
+
+    memory_reads, memory_writes : int
+        Blocks read from / writes sent to memory
+
+    Methods
+    -------
+    access(str, str) / access_addr(int, int)
+        Process one processor request
+
+    amat()
+        returns the average memory access time in cycles
+
+    out()
+        prints every level's metrics and the amat
+    """
+    MODES = ('non-inclusive', 'inclusive', 'exclusive')
+
+    def __init__(self, levels, latencies, memory_latency, mode = 'non-inclusive'):
+        if( mode not in self.MODES ): raise ValueError("unknown hierarchy mode " + str(mode))
+        if( len(levels) != len(latencies) ): raise ValueError("every level needs a latency")
+        #a block moving between levels of different block sizes would leave part of it behind
+        if( mode == 'exclusive' and len(set(cache.block_size for cache in levels)) > 1 ):
+            raise ValueError("every level of an exclusive hierarchy needs the same block size")
+        self.levels = levels
+        self.latencies = latencies
+        self.memory_latency = memory_latency
+        self.mode = mode
+        self.exclusive = mode == 'exclusive'
+        self.inclusive = mode == 'inclusive'
+
+        self.demand_accesses = [0 for i in levels]
+        self.demand_misses = [0 for i in levels]
+        self.memory_reads = 0
+        self.memory_writes = 0
+
+    def access(self, string, access):
+        self.access_addr(Cache.hex_2_int(string), 1 if access == 'w' else 0)
+
+    def access_addr(self, addr, access_type):
+        self.request(0, addr, access_type, True)
+
+    def request(self, i, addr, access_type, demand):
+        """
+        Sends a request to level i , returns 1 if an exclusive level handed up a dirty block
+        """
+        if( i == len(self.levels) ):
+            if( access_type ): self.memory_writes += 1
+            else: self.memory_reads += 1
+            return 0
+
+        cache = self.levels[i]
+        if( demand ): self.demand_accesses[i] += 1
+
+        if( self.exclusive and i > 0 ):
+            if( cache.lookup(addr, access_type) ):
+                #a write only updates the copy , a read moves the block up
+                if( access_type ):
+                    cache.insert(addr, 1)
+                    return 0
+                return cache.invalidate(addr)
+            if( demand ): self.demand_misses[i] += 1
+            return self.request(i + 1, addr, access_type, demand)
+
+        hit_status = cache.access_addr(addr, access_type)
+        #write through (and not allocated writes) carry on to the next level
+        write_on = access_type == 1 and (not cache.write_back or hit_status == -2)
+
+        if( hit_status != 1 ):
+            if( demand ): self.demand_misses[i] += 1
+            if( hit_status != -2 ):
+                #the victim is read before the fill below can touch this level again
+                if( hit_status == -1 ): victim, victim_dirty = cache.victim(addr)
+                if( self.request(i + 1, addr, 0, demand) ): cache.insert(addr, 1)
+                if( hit_status == -1 ): self.evicted(i, victim, victim_dirty)
+
+        if( write_on ): self.request(i + 1, addr, 1, False)
+        return 0
+
+    def evicted(self, i, addr, dirty):
+        """
+        Handles a block evicted from level i
+        """
+        if( self.inclusive ):
+            #the levels above may not keep a block this level has dropped
+            size = self.levels[i].block_size
+            for upper in self.levels[:i]:
+                for a in range(addr, addr + size, min(size, upper.block_size)):
+                    if( upper.invalidate(a) ): dirty = 1
+
+        if( self.exclusive ):
+            if( i + 1 == len(self.levels) ):
+                if( dirty ): self.memory_writes += 1
+                return
+            lower = self.levels[i + 1]
+            if( lower.insert(addr, dirty) == -1 ):
+                victim, victim_dirty = lower.victim(addr)
+                self.evicted(i + 1, victim, victim_dirty)
+            return
+
+        if( dirty ): self.write_back(i + 1, addr, self.levels[i].block_size)
+
+    def write_back(self, i, addr, size):
+        """
+        Writes the dirty block of size bytes at addr (evicted from level i - 1) to level i
+        """
+        if( i == len(self.levels) ):
+            self.memory_writes += 1
+            return
+        cache = self.levels[i]
+        if( cache.block_size > size ):
+            #only part of a block here , written like any write (a miss reads the rest)
+            self.request(i, addr, 1, False)
+            return
+
+        for a in range(addr, addr + size, cache.block_size):
+            hit_status = cache.write_block(a)
+            if( hit_status == -1 ):
+                victim, victim_dirty = cache.victim(a)
+                self.evicted(i, victim, victim_dirty)
+            #write through (and not allocated writes) carry on to the next level
+            if( not cache.write_back or hit_status == -2 ): self.write_back(i + 1, a, cache.block_size)
+
+    def amat(self):
+        if( self.demand_accesses[0] == 0 ): return 0.0
+        cycles = sum(t * n for t, n in zip(self.latencies, self.demand_accesses))
+        cycles += self.memory_latency * self.demand_misses[-1]
+        return cycles / self.demand_accesses[0]
+
+    def out(self):
+        for i, cache in enumerate(self.levels):
+            print("L" + str(i + 1), ":")
+            cache.out()
+        print("Memory reads  = ", self.memory_reads)
+        print("Memory writes = ", self.memory_writes)
+        print("AMAT = ", self.amat())
+
+
+##########################################  Checkpoints  ################################################################
+#Snapshot layout : magic , then the zlib compressed pickle of (state, random generator state) ,
+#a checkpoint file puts the number of requests already processed (uint64) between the two
+CHECKPOINT_MAGIC = b'CCKP'
+CHECKPOINT_POSITION = struct.Struct('<Q')
+
+def snapshot(state):
+    """
+    Returns a compact binary copy of state (a Cache , a CacheHierarchy or any
+    picklable structure holding them) and of the random generator used by the
+    random replacement policy , detach event logs first.
+    """
+    data = pickle.dumps((state, random.getstate()), pickle.HIGHEST_PROTOCOL)
+    return CHECKPOINT_MAGIC + zlib.compress(data)
+
+def restore(data):
+    """
+    Returns a new copy of the state saved by snapshot and puts the random
+    generator back where it was , a warmed cache can be restored any number
+    of times to fork runs from it.
+    """
+    if( data[:len(CHECKPOINT_MAGIC)] != CHECKPOINT_MAGIC ):
+        raise ValueError("not a simulator snapshot")
+    state, random_state = pickle.loads(zlib.decompress(data[len(CHECKPOINT_MAGIC):]))
+    random.setstate(random_state)
+    return state
+
+class checkpoint:
+    """
+    A file holding the latest snapshot of a long simulation , a crashed run
+    goes on from it instead of starting over
+
+    Attributes
+    ----------
+    path : str
+        Path of the checkpoint file
+
+    every : int
+        Number of requests between two snapshots
+
+    position : int
+        Requests processed when the last snapshot was saved or loaded
+
+    Methods
+    -------
+    save(state, int)
+        replaces the file with a snapshot of state taken after that many requests
+
+    load()
+        returns the state in the file (None if there is no file) and sets position
+
+    replay(cache, chunks)
+        feeds the (address, access_type) chunks of a trace to cache , saving
+        every so many requests , returns the cache
+    """
+    def __init__(self, path, every = 1 << 20):
+        self.path = path
+        self.every = every
+        self.position = 0
+
+    def save(self, state, position):
+        #written next to the old file and renamed over it , a crash while
+        #saving leaves the previous snapshot intact
+        fd, tmp = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(CHECKPOINT_POSITION.pack(position))
+            f.write(snapshot(state))
+        os.replace(tmp, self.path)
+        self.position = position
+
+    def load(self):
+        if( not os.path.exists(self.path) ): return None
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.position, = CHECKPOINT_POSITION.unpack_from(data)
+        return restore(data[CHECKPOINT_POSITION.size:])
+
+    def replay(self, cache, chunks):
+        """
+        cache is a Cache or a CacheHierarchy , it is replaced by the one in
+        the checkpoint file when there is one and the requests that one has
+        already seen are skipped.
+        """
+        saved = self.load()
+        if( saved is None ): self.position = 0
+        else: cache = saved
+
+        done = 0
+        next_save = self.position + self.every
+        for chunk in chunks:
+            n = len(chunk)
+            if( done + n <= self.position ):
+                done += n
+                continue
+            i = max(0, self.position - done)
+            while( i < n ):
+                j = min(n, next_save - done)
+                for addr, access_type in chunk[i:j]:
+                    cache.access_addr(addr, access_type)
+                i = j
+                if( done + i == next_save ):
+                    self.save(cache, next_save)
+                    next_save += self.every
+            done += n
+        return cache
 
 
 ####################################  File Reading and printing Section.  ##################################################
 
-#opening the input file to be read.
-f = open( 'input.txt', 'r')
-x = f.readlines()
-
-#collecting cache related data.
-cache_size, cache_linesize , dm_cache , replacement_policy = x[:4]
-#Servicing Memory requests
-cache = Cache(int(dm_cache.strip()),int(replacement_policy.strip()),int(cache_size.strip()),int(cache_linesize.strip()) )
-for i in x[4:]:
-    if(i == '\n'):continue
-    addr, access = i.split()
-    cache.access(addr.strip(), access.strip())
-
-########################################### Printing Section #############################################################    
-#Printing cache related stuff
-print("Cache Size : ", end = " ")
-print(cache_size.strip())
-print("Block Size : " , end = " ")
-print(cache_linesize.strip())
-print("Type of Cache : ",end = " ")
-
-if(int(dm_cache.strip()) == 0):print("Fully Associative Cache")
-elif(int(dm_cache.strip()) == 1):print("Direct - Mapped Cache")
-else:
-    print("Set Associative Cache ",end = " " )
-    print(dm_cache.strip(),end = ' ')
-    print("Way")
-
-print("Replacement Policy : ",end = " ")
-if(int(replacement_policy.strip()) == 0): print("Random Replacement Policy")
-elif(int(replacement_policy.strip()) == 1): print("LRU Replacement Policy")
-else:print("Pseudo LRU Replacement Policy" )
-
-#finally printing metrics of class.
-cache.out()
-
-f.close()
+def main(path = 'input.txt', checkpoint_path = None, checkpoint_every = 1 << 20, warmup = None, warmup_window = None,
+         interval = None, interval_path = 'intervals'):
+    #binary traces (see write_binary_trace) are replayed straight from the file
+    with open( path, 'rb') as f:
+        is_binary = f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+
+    if( is_binary ):
+        trace = binary_trace(path)
+        f = None
+    else:
+        #opening the input file to be read.
+        f = open( path, 'r')
+        trace = trace_reader(f)
+
+    #collecting cache related data.
+    cache_size, cache_linesize, dm_cache, replacement_policy = trace.cache_size, trace.block_size, trace.associativity, trace.replacement_policy
+
+    #Servicing Memory requests , the report splits capacity and conflict misses exactly
+    cache = Cache(dm_cache, replacement_policy, cache_size, cache_linesize, exact_3c = True)
+
+    #warmup is a number of references or (below 1) a fraction of the trace ,
+    #warmup_window detects the end of the warm-up (warmup is then its bound)
+    if( warmup is not None and 0 < warmup < 1 ):
+        if( is_binary ):
+            total = trace.count
+        else:
+            with open( path, 'r') as g:
+                total = sum(len(chunk) for chunk in trace_reader(g))
+        warmup = int(warmup * total)
+    if( warmup or warmup_window ):
+        cache.start_warmup(warmup or None, warmup_window)
+
+    #counters every interval accesses , written to <interval_path>.csv and
+    #the per set misses to <interval_path>_sets.csv
+    if( interval ): cache.attach_stats(interval)
+
+    if( checkpoint_path is not None ):
+        #snapshots every checkpoint_every requests , a rerun resumes from the last one
+        cache = checkpoint(checkpoint_path, checkpoint_every).replay(cache, trace)
+        if( f is not None ): f.close()
+    elif( is_binary ):
+        cache.replay(trace)
+    else:
+        for chunk in trace:
+            for addr, access_type in chunk:
+                cache.access_addr(addr, access_type)
+        f.close()
+
+    if( interval ):
+        stats = cache.detach_stats()
+        with open( interval_path + '.csv', 'w') as g:
+            stats.write_csv(g)
+        with open( interval_path + '_sets.csv', 'w') as g:
+            stats.write_heatmap_csv(g)
+
+    ########################################### Printing Section #############################################################    
+    #Printing cache related stuff
+    print("Cache Size : ", end = " ")
+    print(cache_size)
+    print("Block Size : " , end = " ")
+    print(cache_linesize)
+    print("Type of Cache : ",end = " ")
+
+    if(dm_cache == 0):print("Fully Associative Cache")
+    elif(dm_cache == 1):print("Direct - Mapped Cache")
+    else:
+        print("Set Associative Cache ",end = " " )
+        print(dm_cache,end = ' ')
+        print("Way")
+
+    print("Replacement Policy : ",end = " ")
+    if(replacement_policy == 0): print("Random Replacement Policy")
+    elif(replacement_policy == 1): print("LRU Replacement Policy")
+    else:print("Pseudo LRU Replacement Policy" )
+
+    #finally printing metrics of class.
+    cache.out()
+
+    tracker = cache.replacer.first_touch
+    print("Compulsory miss tracker : ", tracker.mode(), ",", tracker.count, "blocks ,", tracker.memory(), "bytes")
+
+
+if __name__ == '__main__':
+    main()
 ######################################################################################################################
-        
@@ -10,6 +10,10 @@ Note : Require Python 2.7 or more version to run.
 
 
 import math
+import statistics
+import time
+
+from cache_HakeshED import Cache, checkpoint, snapshot, restore
 
 ############# metric-variables ################################
 
@@ -25,37 +29,442 @@ cpi = 0
 stalls = 0
 data_stalls = 0
 control_stalls = 0
+icache_stalls = 0 #cycles waiting for instruction cache misses
+dcache_stalls = 0 #cycles waiting for data cache misses
+
+predictions = 0    #control instructions fetched with a predictor
+mispredictions = 0 #of those , fetched down the wrong path
+
+################ cache configuration ##########################
+#geometry of the caches in front of lcache[] and dcache[] ,
+#Cache(associativity, replacement_policy, cache_size, block_size)
+ICACHE_CONFIG = (2, 1, 64, 4)
+DCACHE_CONFIG = (2, 1, 64, 4)
+
+#cycles a miss keeps the stage waiting
+ICACHE_MISS_PENALTY = 10
+DCACHE_MISS_PENALTY = 10
+
+################ forwarding ###################################
+#none : operands are read from the register file only
+#ex   : EX -> EX , an ALU result goes from the EX/MEM latch to the next EX
+#full : EX -> EX and MEM -> EX , only a load followed by its use stalls
+FORWARD_NONE, FORWARD_EX, FORWARD_FULL = 'none', 'ex', 'full'
+FORWARDING_MODES = (FORWARD_NONE, FORWARD_EX, FORWARD_FULL)
+FORWARDING = FORWARD_NONE
+
+################ branch prediction ############################
+#none      : fetch stops after a JMP / BEQZ until it leaves EX
+#not-taken : fetch goes on with the next instruction
+#1-bit , 2-bit , gshare : a BTB hit predicted taken fetches the target next
+BRANCH_PREDICTORS = ('none', 'not-taken', '1-bit', '2-bit', 'gshare')
+BRANCH_PREDICTOR = 'none'
+
+#entries of the counter tables and the branch target buffer (powers of 2)
+PREDICTOR_ENTRIES = 16
+BTB_ENTRIES = 16
+
+################ comparisons ##################################
+#True also runs the program once per forwarding mode and once per branch
+#predictor (8 more runs) for the tables of output.txt
+COMPARE = False
+
+################ sampling #####################################
+#(period, window, warmup) to estimate the metrics with sample() ,
+#None runs the whole program through the pipeline
+SAMPLING = None
 
 ################ global variables #############################
 #store 8 bit information as strings (256 entries)
 lcache = [] 
 dcache = []
 
-RF = [0,] #16 entries,8-bit each
+RF = [0] * 16 #16 entries,8-bit each
 
 PC = 0
 IR = 0
 
-#############################################################
-def InstructionFetch():
+#timing only caches , the bytes stay in lcache[] / dcache[]
+icache = Cache(*ICACHE_CONFIG)
+dcache_timing = Cache(*DCACHE_CONFIG)
+
+#stall cycles the last fetch / memory access still owes the pipeline
+fetch_wait = 0
+memory_wait = 0
+
+#block of the last instruction fetch and the fetches that hit it since the last run
+fetch_block = -1
+fetch_repeats = 0
+
+def icache_latency(address):
+    #extra cycles to fetch the byte at address through the instruction cache
+    if( icache.access_addr(address, 0) == 1 ): return 0
+    return ICACHE_MISS_PENALTY
+
+def dcache_latency(address, write):
+    #extra cycles to read / write the byte at address through the data cache
+    if( dcache_timing.access_addr(address, write) == 1 ): return 0
+    return DCACHE_MISS_PENALTY
+
+############### branch prediction #############################
+class not_taken_predictor:
+    """
+    Static predictor , every branch falls through
+
+    Methods
+    -------
+    predict(int)
+        returns True if the branch at the address is predicted taken
+
+    update(int, bool)
+        trains the predictor with the outcome of the branch at the address
+    """
+    def predict(self, pc):
+        return False
+
+    def update(self, pc, taken):
+        pass
+
+class counter_predictor:
+    """
+    A table of saturating counters indexed by the instruction address
+
+    Attributes
+    ----------
+    counters : bytearray
+        One counter per entry , a branch is predicted taken in the upper half
+    maximum, threshold : int
+        1, 1 for 1-bit counters , 3, 2 for 2-bit counters
+    mask : int
+        entries - 1 , the number of entries is a power of 2
+    """
+    def __init__(self, entries, bits):
+        self.maximum = (1 << bits) - 1
+        self.threshold = 1 << (bits - 1)
+        self.mask = entries - 1
+        #weakly not taken
+        self.counters = bytearray([self.threshold - 1]) * entries
+
+    def index(self, pc):
+        return (pc >> 1) & self.mask
+
+    def predict(self, pc):
+        return self.counters[self.index(pc)] >= self.threshold
+
+    def update(self, pc, taken):
+        i = self.index(pc)
+        counter = self.counters[i]
+        if( taken ):
+            if( counter < self.maximum ): self.counters[i] = counter + 1
+        elif( counter > 0 ): self.counters[i] = counter - 1
+
+class gshare_predictor(counter_predictor):
+    """
+    2-bit counters indexed by the instruction address xor the global history
+
+    Attributes
+    ----------
+    history : int
+        Outcomes of the last branches , the latest one in bit 0
+    """
+    def __init__(self, entries, bits = 2):
+        counter_predictor.__init__(self, entries, bits)
+        self.history = 0
+
+    def index(self, pc):
+        return ((pc >> 1) ^ self.history) & self.mask
+
+    def update(self, pc, taken):
+        counter_predictor.update(self, pc, taken)
+        self.history = ((self.history << 1) | taken) & self.mask
+
+class btb:
+    """
+    Direct mapped branch target buffer , tagged with the whole address
+
+    Attributes
+    ----------
+    tags, targets : List
+        Address of the branch (-1 if the entry is empty) and its taken target
+    jumps : bytearray
+        1 for an unconditional jump , always predicted taken
+
+    Methods
+    -------
+    lookup(int)
+        returns the entry of the branch at the address , -1 on a miss
+
+    update(int, int, bool)
+        records the taken target of a branch
+    """
+    def __init__(self, entries):
+        self.mask = entries - 1
+        self.tags = [-1] * entries
+        self.targets = [0] * entries
+        self.jumps = bytearray(entries)
+
+    def lookup(self, pc):
+        i = (pc >> 1) & self.mask
+        if( self.tags[i] == pc ): return i
+        return -1
+
+    def update(self, pc, target, jump):
+        i = (pc >> 1) & self.mask
+        self.tags[i] = pc
+        self.targets[i] = target
+        self.jumps[i] = jump
+
+def make_predictor(name):
+    #direction predictor for a BRANCH_PREDICTORS name , None for 'none'
+    if( name == 'none' ): return None
+    if( name == 'not-taken' ): return not_taken_predictor()
+    if( name == '1-bit' ): return counter_predictor(PREDICTOR_ENTRIES, 1)
+    if( name == '2-bit' ): return counter_predictor(PREDICTOR_ENTRIES, 2)
+    if( name == 'gshare' ): return gshare_predictor(PREDICTOR_ENTRIES)
+    raise ValueError("unknown branch predictor " + repr(name))
+
+def make_btb(name):
+    #the static predictors never fetch a target , they go without a BTB
+    if( name == 'none' or name == 'not-taken' ): return None
+    return btb(BTB_ENTRIES)
+
+predictor = make_predictor(BRANCH_PREDICTOR)
+branch_target = make_btb(BRANCH_PREDICTOR)
+
+#address the fetch unit goes to after the last fetched instruction
+predicted_PC = 0
 
-    #return nothing
+#############################################################
+#instruction class of every opcode , 12 - 14 are not used
+#0 : arithmetic (ADD SUB MUL INC) , 1 : logical (AND OR NOT XOR)
+#2 : data (LOAD STORE) , 3 : control (JMP BEQZ) , 4 : halt (HLT)
+OPCODE_CLASS = (0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 3, 3, None, None, None, 4)
 
-def InstructionDecode():
+def InstructionFetch():
+    #fetches the instruction at PC through the instruction cache , moves PC
+    #on and returns fetch_wait ; its bytes only reach IR when it is decoded
+    global PC, fetch_wait, icache_stalls, fetch_block, fetch_repeats, predicted_PC
+    pc = PC
+
+    #a fetch from the block of the previous fetch is an LRU / PLRU hit that
+    #does not change the cache state , it is only counted (see run)
+    if( pc >> icache.eblock_size == fetch_block ):
+        fetch_wait = 0
+        fetch_repeats += 1
+    else:
+        #both bytes of the instruction go through the instruction cache ,
+        #the second byte is only looked up when it starts a new block
+        fetch_wait = icache_latency(pc)
+        if( (pc + 1) & (icache.block_size - 1) == 0 ): fetch_wait += icache_latency(pc + 1)
+        fetch_block = (pc + 1) >> icache.eblock_size
+        icache_stalls += fetch_wait
+
+    #a BTB hit predicted taken sends the next fetch to the target , there is
+    #only a BTB with a predictor
+    PC = predicted_PC = pc + 2
+    if( branch_target is not None ):
+        i = branch_target.lookup(pc)
+        if( i >= 0 and (branch_target.jumps[i] or predictor.predict(pc)) ):
+            predicted_PC = branch_target.targets[i]
+    return fetch_wait
+
+def decode(word):
+    #opcode , R1 , R2 , R3 , L1 of a 16-bit instruction
+    opcode = word >> 12
+    R1 = (word >> 8) & 0xf
+    R2 = (word >> 4) & 0xf
+    R3 = word & 0xf
+
+    #L1 is the signed offset of the instruction (in place of R1 R2 for JMP ,
+    #R2 R3 for BEQZ , R3 for LOAD / STORE)
+    if( opcode == 10 ): L1 = (((word >> 4) & 0xff) ^ 0x80) - 0x80
+    elif( opcode == 11 ): L1 = ((word & 0xff) ^ 0x80) - 0x80
+    elif( opcode == 8 or opcode == 9 ): L1 = (R3 ^ 0x8) - 0x8
+    else: L1 = 0
 
     return opcode, R1, R2, R3, L1
 
-def Execute(opcode, A, B):
+def InstructionDecode(pc):
+    #IR gets the four hex digits of the instruction at pc : opcode R1 R2 R3
+    global IR
+    IR = lcache[pc] + lcache[pc + 1]
+    return decode(int(IR, 16))
+
+#lcache[] decoded once , one (opcode, R1, R2, R3, L1) tuple per instruction
+#address // 2 , None when the bytes changed since
+decoded = []
+decoded_from = None
+
+def predecode():
+    #decodes the whole of lcache[] , run() does it when lcache[] is a new list
+    global decoded, decoded_from
+    decoded = [decode(int(lcache[pc] + lcache[pc + 1], 16)) for pc in range(0, len(lcache) - 1, 2)]
+    decoded_from = lcache
+
+def invalidate_decoded(address):
+    #the byte at address was written , its instruction is decoded again when fetched
+    if( decoded_from is not None and 0 <= address < 2 * len(decoded) ):
+        decoded[address >> 1] = None
+
+############### execute handlers ##############################
+#one handler per opcode , it counts its instruction class and returns
+#(ALUOutput, cond) , registers are 8-bit so results wrap around
+def execute_add(A, B):
+    global arthmetic_instructions
+    arthmetic_instructions += 1
+    return (A + B) & 0xff, False
+
+def execute_sub(A, B):
+    global arthmetic_instructions
+    arthmetic_instructions += 1
+    return (A - B) & 0xff, False
+
+def execute_mul(A, B):
+    global arthmetic_instructions
+    arthmetic_instructions += 1
+    return (A * B) & 0xff, False
+
+def execute_inc(A, B):
+    global arthmetic_instructions
+    arthmetic_instructions += 1
+    return (A + 1) & 0xff, False
+
+def execute_and(A, B):
+    global logical_instructions
+    logical_instructions += 1
+    return A & B, False
+
+def execute_or(A, B):
+    global logical_instructions
+    logical_instructions += 1
+    return A | B, False
+
+def execute_not(A, B):
+    global logical_instructions
+    logical_instructions += 1
+    return ~A & 0xff, False
+
+def execute_xor(A, B):
+    global logical_instructions
+    logical_instructions += 1
+    return A ^ B, False
+
+def execute_memory(A, B):
+    #LOAD / STORE , effective address R2 + X
+    global data_instructions
+    data_instructions += 1
+    return (A + B) & 0xff, False
+
+def execute_jmp(A, B):
+    #target is relative to the next instruction
+    global control_instructions
+    control_instructions += 1
+    return (PC + (B << 1)) & 0xff, True
+
+def execute_beqz(A, B):
+    global control_instructions
+    control_instructions += 1
+    return (PC + (B << 1)) & 0xff, A == 0
+
+def execute_hlt(A, B):
+    global halt_instructions
+    halt_instructions += 1
+    return 0, False
+
+def execute_invalid(A, B):
+    #the opcode is the high digit of the instruction's first byte
+    raise ValueError("invalid opcode %d at PC %d" % (int(lcache[PC - 2], 16) >> 4, PC - 2))
+
+EXECUTE = [execute_add, execute_sub, execute_mul, execute_inc,
+           execute_and, execute_or, execute_not, execute_xor,
+           execute_memory, execute_memory, execute_jmp, execute_beqz,
+           execute_invalid, execute_invalid, execute_invalid, execute_hlt]
+
+def execute_chain(opcode, A, B):
+    """
+    The if / elif version of the EXECUTE table , kept as the baseline of benchmark_execute
+    """
+    global ALUOutput, cond, arthmetic_instructions, logical_instructions, data_instructions, control_instructions, halt_instructions
+
+    cond = False
+    if( opcode < 4 ):
+        arthmetic_instructions += 1
+        if( opcode == 0 ): ALUOutput = (A + B) & 0xff       #ADD
+        elif( opcode == 1 ): ALUOutput = (A - B) & 0xff     #SUB
+        elif( opcode == 2 ): ALUOutput = (A * B) & 0xff     #MUL
+        else: ALUOutput = (A + 1) & 0xff                    #INC
+    elif( opcode < 8 ):
+        logical_instructions += 1
+        if( opcode == 4 ): ALUOutput = A & B                #AND
+        elif( opcode == 5 ): ALUOutput = A | B              #OR
+        elif( opcode == 6 ): ALUOutput = ~A & 0xff          #NOT
+        else: ALUOutput = A ^ B                             #XOR
+    elif( opcode < 10 ):
+        data_instructions += 1
+        ALUOutput = (A + B) & 0xff                          #effective address R2 + X
+    elif( opcode < 12 ):
+        control_instructions += 1
+        ALUOutput = (PC + (B << 1)) & 0xff                  #target , relative to the next instruction
+        cond = opcode == 10 or A == 0                       #JMP is always taken , BEQZ when R1 is 0
+    elif( opcode == 15 ):
+        halt_instructions += 1
+        ALUOutput = 0
+    else:
+        raise ValueError("invalid opcode %d at PC %d" % (opcode, PC - 2))
 
     return ALUOutput, cond
 
-def Memory(opcode, B):
+def benchmark_execute(count = 1000000):
+    """
+    Times count executions of a mix of every valid opcode through the
+    if / elif chain and through the EXECUTE table , the way run() calls it
+
+    Returns (chain, table) in instructions per second , the instruction
+    class counters are restored afterwards.
+    """
+    global arthmetic_instructions, logical_instructions, data_instructions, control_instructions, halt_instructions
+    counters = (arthmetic_instructions, logical_instructions, data_instructions, control_instructions, halt_instructions)
+
+    valid = [opcode for opcode in range(16) if EXECUTE[opcode] is not execute_invalid]
+    operands = [(valid[i % len(valid)], (i * 7) & 0xff, (i * 13) & 0xff) for i in range(1024)]
+    rounds = max(1, count // len(operands))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for opcode, A, B in operands:
+            execute_chain(opcode, A, B)
+    chain = time.perf_counter() - start
+
+    table = EXECUTE
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for opcode, A, B in operands:
+            table[opcode](A, B)
+    dispatch = time.perf_counter() - start
+
+    arthmetic_instructions, logical_instructions, data_instructions, control_instructions, halt_instructions = counters
+    executed = rounds * len(operands)
+    return executed / chain, executed / dispatch
 
-    return data #in load instruction
+def Memory(opcode, B):
+    global memory_wait, dcache_stalls
+
+    #LOAD (8) reads , STORE (9) writes dcache[ALUOutput]
+    write = 1 if opcode == 9 else 0
+    memory_wait = dcache_latency(ALUOutput, write)
+    dcache_stalls += memory_wait
+
+    if( write ):
+        dcache[ALUOutput] = format(B & 0xff, '02x')
+        #with one memory for code and data (dcache is lcache) the store may
+        #have rewritten an instruction
+        if( dcache is decoded_from ): invalidate_decoded(ALUOutput)
+        return
+    return int(dcache[ALUOutput], 16) #in load instruction
     #return nothing if store
 
 def WriteBack(R1, result):
-
+    RF[R1] = result
     #return nothing
 
 ###############################################################
@@ -67,58 +476,501 @@ ALUOutput = 0
 
 cond = True
 
-stall = False
-num_stalls = 0
-
-clockCycles = 1
-while(clockCycles++):
-
-    #Write back handling
-    if(number == 1):
-
-
-
-        number++
-
-    #memory handling
-    if(number == 2):
-
-        if(stall):number --
-
-    #execute handling
-    if(number == 3):
-
-        if(normal) number++
-        else number--
-
-    #decoding handing
-    if(number == 4):
-
-    #instruction fetching handling
-    if(number == 5):
-        //data hazard logic..
-        if(data hazard):
-            stall = True
-            num_stalls = 3
-
-#add r1, r2, r3
-#add r4, r1, r8 : current
+clockCycles = 0
+
+#the instructions in flight : cycle at which the last one entered ID , EX ,
+#MEM and WB and the first cycle IF may fetch , per register the WB cycle of
+#the last write and the first EX cycle it can be forwarded to (None if not)
+timing = [1, 1, 1, 4, 1]
+operands_written = [0] * 16
+operands_forwarded = [None] * 16
+
+#HLT went through the pipeline
+halted = False
+
+def operand_cycle(forwarding, s_id, ex_free, written, forwarded):
+    """
+    Returns the first cycle ID can hand a source register to EX
+
+    s_id is the earliest ID cycle of the consumer and ex_free the first cycle
+    EX is free for it , written is the WB cycle of the producer and forwarded
+    the first EX cycle that can take the value from a pipeline register
+    (EX/MEM for ALU results , MEM/WB for loads , None when it is not forwarded)
+    """
+    if( s_id > written ): return s_id                   #already in the register file
+    if( forwarded is not None ):
+        ex = s_id + 1 if s_id + 1 > ex_free else ex_free
+        if( forwarding == FORWARD_EX ):
+            #the EX/MEM latch holds the result until the producer enters WB
+            if( ex < written ): return s_id
+        else:
+            #MEM/WB -> EX covers the cycles after that
+            if( ex >= forwarded ): return s_id
+            return forwarded - 1
+    return written + 1
+
+def run(max_instructions = None, forwarding = None, resume = False):
+    """
+    Runs the program in lcache[] from PC until HLT (or max_instructions)
+
+    Every instruction goes through the stage functions in program order
+    (InstructionFetch , InstructionDecode behind the decode cache , the
+    EXECUTE handlers , Memory and WriteBack) and the cycle it enters IF ,
+    ID , EX , MEM and WB is computed from the instruction in front of it :
+
+    - an instruction enters a stage only once the one ahead has left it
+    - ID waits for the source registers , without forwarding a register is
+      readable the cycle after the WB that writes it (see operand_cycle for
+      the EX -> EX and MEM -> EX modes)
+    - without a predictor the instruction after a JMP / BEQZ is fetched the
+      cycle after the branch leaves EX , with one only a mispredicted branch
+      (predicted_PC is not the next PC) holds the fetch back that long
+    - IF and MEM take fetch_wait / memory_wait extra cycles on cache misses
+
+    forwarding is one of FORWARD_NONE , FORWARD_EX , FORWARD_FULL
+    (FORWARDING when not given). The pipeline starts empty unless resume is
+    True , then it goes on behind the instructions of the previous run.
+
+    Open item : the target of 1M instructions / s is not met , a detailed
+    run does about 290k / s (sample about 840k / s) , the per instruction
+    cost is in the stage calls and the operand / hazard bookkeeping
+
+    Returns the number of clock cycles
+    """
+    global PC, IR, A, B, LMD, ALUOutput, memory_wait, clockCycles, halted, fetch_repeats
+    global instructions, cpi, stalls, data_stalls, control_stalls, predictions, mispredictions
+
+    if( forwarding is None ): forwarding = FORWARDING
+    if( forwarding not in FORWARDING_MODES ):
+        raise ValueError("unknown forwarding mode " + repr(forwarding))
+
+    if( decoded_from is not lcache ): predecode()
+    execute = EXECUTE
+
+    if( not resume ): drain()
+    p_id, p_ex, p_mem, p_wb, fetch_ready = timing
+    start = p_wb
+    written, forwarded = operands_written, operands_forwarded
+    rf, instructions_of = RF, decoded
+
+    limit = float('inf') if max_instructions is None else max_instructions
+    count = 0
+    pc = PC
+    while( count < limit ):
+        #instruction fetch
+        s_if = p_id
+        if( fetch_ready > s_if ):
+            control_stalls += fetch_ready - s_if
+            s_if = fetch_ready
+        pc = PC
+        s_id = s_if + InstructionFetch() + 1
+
+        #instruction decode , operands are read at the end of the stall ,
+        #the fields come from the decode cache when it has them
+        instruction = instructions_of[pc >> 1]
+        if( instruction is None ):
+            instruction = instructions_of[pc >> 1] = InstructionDecode(pc)
+        opcode, R1, R2, R3, L1 = instruction
+        if( p_ex > s_id ): s_id = p_ex
+        dest = -1
+        if( opcode < 8 ):
+            if( opcode == 3 ):
+                A, B, sources = rf[R1], 1, (R1,)
+            elif( opcode == 6 ):
+                A, sources = rf[R2], (R2,)
+            else:
+                A, B, sources = rf[R2], rf[R3], (R2, R3)
+            dest = R1
+        elif( opcode < 10 ):
+            A, B = rf[R2], L1
+            if( opcode == 8 ):
+                sources = (R2,)
+                dest = R1
+            else:
+                sources = (R2, R1)                      #STORE also reads R1
+        elif( opcode == 11 ):
+            A, B, sources = rf[R1], L1, (R1,)
+        else:
+            B, sources = L1, ()
+
+        #a later operand can push ID past the forwarding window of an earlier one
+        wait = s_id
+        while( True ):
+            for r in sources:
+                if( wait > written[r] ): continue       #already in the register file
+                cycle = operand_cycle(forwarding, wait, p_mem, written[r], forwarded[r])
+                if( cycle > wait ): break
+            else:
+                break
+            wait = cycle
+        if( wait > s_id ):
+            data_stalls += wait - s_id
+            s_id = wait
+
+        #execute
+        s_ex = s_id + 1
+        if( p_mem > s_ex ): s_ex = p_mem
+        result, taken = execute[opcode](A, B)
+        if( opcode == 10 or opcode == 11 ):
+            branch = pc
+            if( taken ): PC = result
+            if( predictor is None ):
+                fetch_ready = s_ex + 1
+            else:
+                #the wrong path is flushed , fetch restarts once the branch leaves EX
+                predictions += 1
+                if( PC != predicted_PC ):
+                    mispredictions += 1
+                    fetch_ready = s_ex + 1
+                if( opcode == 11 ): predictor.update(branch, taken)
+                if( taken and branch_target is not None ): branch_target.update(branch, result, opcode == 10)
+
+        #memory access
+        s_mem = s_ex + 1
+        if( p_wb > s_mem ): s_mem = p_wb
+        if( opcode == 8 or opcode == 9 ):
+            ALUOutput = result
+            LMD = Memory(opcode, rf[R1])
+            if( opcode == 8 ): result = LMD
+        else:
+            memory_wait = 0
+
+        #write back
+        s_wb = s_mem + memory_wait + 1
+        if( dest >= 0 ):
+            WriteBack(dest, result)
+            written[dest] = s_wb
+            if( forwarding == FORWARD_NONE ): forwarded[dest] = None
+            elif( opcode == 8 ): forwarded[dest] = s_wb if forwarding == FORWARD_FULL else None
+            else: forwarded[dest] = s_mem
+
+        p_id, p_ex, p_mem, p_wb = s_id, s_ex, s_mem, s_wb
+        count += 1
+        if( opcode == 15 ):
+            halted = True
+            break
+    timing[:] = p_id, p_ex, p_mem, p_wb, fetch_ready
+    #IR holds the last instruction , decode cache hits never set it
+    if( count ): IR = lcache[pc] + lcache[pc + 1]
+
+    #repeated fetches never reached the instruction cache , they are its read hits
+    icache.metrics.add('cache_access', fetch_repeats)
+    icache.metrics.add('read_access', fetch_repeats)
+    fetch_repeats = 0
+
+    if( count ):
+        clockCycles = p_wb
+        instructions += count
+        cpi = clockCycles / instructions
+        stalls += p_wb - start - count
+    return clockCycles
+
+def drain():
+    #an empty pipeline , the first instruction is fetched in cycle 1 and
+    #(with no stalls) leaves WB in cycle 5 , 4 cycles after the one before it
+    timing[:] = 1, 1, 1, 4, 1
+    operands_written[:] = [0] * 16
+    operands_forwarded[:] = [None] * 16
+
+def reset(branch_predictor = None):
+    #metric - variables , pipeline caches , predictor (BRANCH_PREDICTOR when
+    #not given) and PC back to their initial values
+    global instructions, arthmetic_instructions, logical_instructions, data_instructions, control_instructions, halt_instructions
+    global cpi, stalls, data_stalls, control_stalls, icache_stalls, dcache_stalls
+    global icache, dcache_timing, fetch_block, fetch_repeats, PC, IR, clockCycles
+    global predictions, mispredictions, predictor, branch_target, predicted_PC, halted
+
+    instructions = arthmetic_instructions = logical_instructions = 0
+    data_instructions = control_instructions = halt_instructions = 0
+    cpi = stalls = data_stalls = control_stalls = icache_stalls = dcache_stalls = 0
+    predictions = mispredictions = 0
+    halted = False
+    drain()
+
+    icache = Cache(*ICACHE_CONFIG)
+    dcache_timing = Cache(*DCACHE_CONFIG)
+    if( branch_predictor is None ): branch_predictor = BRANCH_PREDICTOR
+    predictor = make_predictor(branch_predictor)
+    branch_target = make_btb(branch_predictor)
+    predicted_PC = 0
+    fetch_block = -1
+    fetch_repeats = 0
+    PC = IR = clockCycles = 0
+
+def functional(max_instructions = None):
+    """
+    Executes up to max_instructions from PC with no pipeline timing , only
+    RF[] , dcache[] and PC change (the caches and the predictor are not used)
+
+    The instruction class counters and instructions are updated ,
+    returns the number of instructions executed
+    """
+    global PC, IR, instructions, halted
+
+    if( decoded_from is not lcache ): predecode()
+    execute = EXECUTE
+    rf = RF
+
+    limit = float('inf') if max_instructions is None else max_instructions
+    count = 0
+    while( count < limit ):
+        pc = PC
+        instruction = decoded[pc >> 1]
+        if( instruction is None ):
+            instruction = decoded[pc >> 1] = InstructionDecode(pc)
+        opcode, R1, R2, R3, L1 = instruction
+        PC = pc + 2
+        count += 1
+
+        if( opcode < 8 ):
+            if( opcode == 3 ): rf[R1] = execute[3](rf[R1], 1)[0]
+            else: rf[R1] = execute[opcode](rf[R2], rf[R3])[0]
+        elif( opcode < 10 ):
+            address = execute[opcode](rf[R2], L1)[0]
+            if( opcode == 8 ):
+                rf[R1] = int(dcache[address], 16)
+            else:
+                dcache[address] = format(rf[R1], '02x')
+                if( dcache is decoded_from ): invalidate_decoded(address)
+        elif( opcode == 15 ):
+            execute[15](0, 0)
+            halted = True
+            break
+        else:
+            target, taken = execute[opcode](rf[R1], L1)
+            if( taken ): PC = target
+
+    instructions += count
+    return count
+
+def sample(period = 10000, window = 1000, warmup = 1000, max_instructions = None, z = 1.96, forwarding = None):
+    """
+    SMARTS style sampling of the program from PC until HLT (or max_instructions)
+
+    In every period of instructions , warmup instructions go through the
+    pipeline unmeasured (filling it and warming the caches and predictor) ,
+    the next window are measured and the rest run in functional mode.
+    Warm-up and windows use forwarding (FORWARDING when not given , see run).
+
+    cpi and the stall counters of the measured windows are extrapolated to
+    the whole program with a z (1.96 : 95 %) confidence interval ; the
+    metric - variables are set to the estimates. The instruction class
+    counters need no estimate , every instruction is executed.
+
+    Returns {name : (estimate, half width)} for cpi , stalls , data_stalls ,
+    control_stalls , icache_stalls and dcache_stalls (half width is None
+    with fewer than 2 windows)
+    """
+    global cpi, stalls, data_stalls, control_stalls, icache_stalls, dcache_stalls
+    if( window < 1 or warmup < 0 or period < warmup + window ):
+        raise ValueError("sampling needs 1 <= window and warmup + window <= period")
+
+    names = ('stalls', 'data_stalls', 'control_stalls', 'icache_stalls', 'dcache_stalls')
+    start = instructions
+    limit = float('inf') if max_instructions is None else max_instructions
+    rates = []      #(cpi, stalls per instruction ...) of every window
+    while( not halted and instructions - start < limit ):
+        left = limit - (instructions - start)
+        run(min(warmup, left), forwarding)
+        if( halted or instructions - start >= limit ): break
+
+        #the window starts where the pipeline stands , clockCycles is stale when
+        #warmup is 0 (run(0) only drains the pipeline)
+        cycles, before = timing[3], [globals()[name] for name in names]
+        executed = instructions
+        run(min(window, limit - (instructions - start)), forwarding, resume = True)
+        executed = instructions - executed
+        if( executed ):
+            cycles = timing[3] - cycles
+            rates.append([cycles / executed] + [(globals()[name] - value) / executed for name, value in zip(names, before)])
+        if( halted ): break
+
+        functional(min(period - warmup - window, limit - (instructions - start)))
+
+    total = instructions - start
+    table = {}
+    for i, name in enumerate(('cpi',) + names):
+        values = [rate[i] for rate in rates]
+        if( not values ):
+            table[name] = (0, None)
+            continue
+        mean = statistics.fmean(values)
+        width = z * statistics.stdev(values) / math.sqrt(len(values)) if len(values) > 1 else None
+        if( name != 'cpi' ):
+            mean *= total
+            if( width is not None ): width *= total
+        table[name] = (mean, width)
+
+    cpi = table['cpi'][0]
+    stalls, data_stalls, control_stalls, icache_stalls, dcache_stalls = [table[name][0] for name in names]
+    return table
+
+############### checkpoints ###################################
+#module state a snapshot holds : memories , registers , stage latches , the
+#instructions in flight , the caches and predictor and the metric - variables
+STATE = ('lcache', 'dcache', 'RF', 'PC', 'IR', 'A', 'B', 'LMD', 'ALUOutput', 'cond',
+         'clockCycles', 'timing', 'operands_written', 'operands_forwarded', 'halted',
+         'fetch_wait', 'memory_wait', 'fetch_block', 'fetch_repeats', 'icache', 'dcache_timing',
+         'predictor', 'branch_target', 'predicted_PC',
+         'instructions', 'arthmetic_instructions', 'logical_instructions', 'data_instructions',
+         'control_instructions', 'halt_instructions', 'cpi', 'stalls', 'data_stalls',
+         'control_stalls', 'icache_stalls', 'dcache_stalls', 'predictions', 'mispredictions')
+
+def save_state():
+    #compact binary snapshot of the simulator , see cache_HakeshED.snapshot
+    return snapshot({name : globals()[name] for name in STATE})
+
+def load_state(data):
+    #puts the simulator back to a save_state snapshot , any number of runs
+    #can be forked from the same one
+    global decoded_from
+    globals().update(restore(data))
+    decoded_from = None
+
+def run_checkpointed(path, every = 1000000, forwarding = None):
+    """
+    Runs the program until HLT in slices of every instructions and saves
+    the simulator to the checkpoint file path after each slice
+
+    If path already holds a snapshot the run goes on from it (the pipeline
+    continues with the instructions that were in flight). Returns the number
+    of clock cycles.
+    """
+    global decoded_from
+    saver = checkpoint(path, every)
+    state = saver.load()
+    resume = state is not None
+    if( resume ):
+        globals().update(state)
+        decoded_from = None
+
+    while( not halted ):
+        run(every, forwarding, resume)
+        resume = True
+        saver.save({name : globals()[name] for name in STATE}, instructions)
+    return clockCycles
+
+def compare(runs, max_instructions = None):
+    """
+    Runs the program once for every (forwarding, branch_predictor) pair in
+    runs , from the current lcache[] , dcache[] and RF[]
+
+    The memories and registers are restored after every run , the metric -
+    variables are left as the last run set them. Returns one
+    (data_stalls, control_stalls, accuracy, cpi) tuple per run.
+    """
+    global dcache, RF
+    start_dcache, start_RF = list(dcache), list(RF)
+
+    table = []
+    for forwarding, branch_predictor in runs:
+        dcache, RF = list(start_dcache), list(start_RF)
+        reset(branch_predictor)
+        run(max_instructions, forwarding)
+        table.append((data_stalls, control_stalls, accuracy(), cpi))
+
+    dcache, RF = start_dcache, start_RF
+    return table
+
+def compare_forwarding(max_instructions = None):
+    #{mode : (data_stalls, cpi)} for every forwarding mode
+    table = compare([(mode, None) for mode in FORWARDING_MODES], max_instructions)
+    return {mode : (row[0], row[3]) for mode, row in zip(FORWARDING_MODES, table)}
+
+def compare_predictors(max_instructions = None):
+    #{name : (accuracy, control_stalls, cpi)} for every branch predictor
+    table = compare([(None, name) for name in BRANCH_PREDICTORS], max_instructions)
+    return {name : (row[2], row[1], row[3]) for name, row in zip(BRANCH_PREDICTORS, table)}
+
+def accuracy():
+    #fraction of the predicted control instructions that fetched the right path
+    if( predictions == 0 ): return 0
+    return (predictions - mispredictions) / predictions
 
 #############################################################
-#Read from lcache.txt to lcache[]
-
-
-#Read from dcache.txt to dcache[]
-
-
-#Read from RF.txt to RF[]
-
-
-#writing dcache back into dcache.txt
-
-
-#writing metrics - variables to output.txt 
-
-
-
+def read_bytes(path, entries):
+    #one 8-bit hex value per line , missing entries are 00
+    with open(path, 'r') as f:
+        values = [line.strip().lower() for line in f if line.strip()]
+    return values + ['00'] * (entries - len(values))
+
+def write_metrics(f):
+    f.write("Total number of instructions executed: " + str(instructions) + "\n")
+    f.write("Number of instructions in each class\n")
+    f.write("Arithmetic instructions              : " + str(arthmetic_instructions) + "\n")
+    f.write("Logical instructions                 : " + str(logical_instructions) + "\n")
+    f.write("Data instructions                    : " + str(data_instructions) + "\n")
+    f.write("Control instructions                 : " + str(control_instructions) + "\n")
+    f.write("Halt instructions                    : " + str(halt_instructions) + "\n")
+    f.write("Cycles Per Instruction               : " + str(cpi) + "\n")
+    f.write("Total number of stalls               : " + str(stalls) + "\n")
+    f.write("Data stalls (RAW)                    : " + str(data_stalls) + "\n")
+    f.write("Control stalls                       : " + str(control_stalls) + "\n")
+    f.write("Instruction cache stalls             : " + str(icache_stalls) + "\n")
+    f.write("Data cache stalls                    : " + str(dcache_stalls) + "\n")
+
+def write_estimates(f, table):
+    f.write("Sampled estimates (period , window , warmup : " + " , ".join(str(value) for value in SAMPLING) + ")\n")
+    for name in ('cpi', 'stalls', 'data_stalls', 'control_stalls', 'icache_stalls', 'dcache_stalls'):
+        estimate, width = table[name]
+        f.write(("  " + name).ljust(37) + ": " + str(estimate) + " +/- " + str(width) + "\n")
+
+def write_predictors(f, table = None):
+    f.write("Branch predictor                     : " + BRANCH_PREDICTOR + " (" + str(BTB_ENTRIES) + " entry BTB)\n")
+    f.write("Prediction accuracy                  : " + str(accuracy()) + "\n")
+    if( table is None ): return
+    f.write("Control stalls per branch predictor\n")
+    for name in BRANCH_PREDICTORS:
+        accuracy_, control, cpi_ = table[name]
+        f.write(("  " + name).ljust(37) + ": " + str(control) + " (accuracy " + str(accuracy_) + " , CPI " + str(cpi_) + ")\n")
+
+def write_forwarding(f, table):
+    f.write("Data stalls per forwarding mode\n")
+    for mode in FORWARDING_MODES:
+        f.write(("  " + mode).ljust(37) + ": " + str(table[mode][0]) + " (CPI " + str(table[mode][1]) + ")\n")
+
+def main():
+    global lcache, dcache, RF
+
+    #Read from lcache.txt to lcache[]
+    lcache = read_bytes('lcache.txt', 256)
+
+    #Read from dcache.txt to dcache[]
+    dcache = read_bytes('dcache.txt', 256)
+
+    #Read from RF.txt to RF[]
+    RF = [int(value, 16) for value in read_bytes('RF.txt', 16)]
+
+    #sampled programs only get the estimates , the others run once with
+    #FORWARDING and BRANCH_PREDICTOR (after every forwarding mode and
+    #predictor with COMPARE)
+    if( SAMPLING is not None ):
+        reset()
+        estimates = sample(*SAMPLING)
+    else:
+        if( COMPARE ):
+            table = compare_forwarding()
+            predictor_table = compare_predictors()
+        reset()
+        run()
+
+    #writing dcache back into dcache.txt
+    with open('dcache.txt', 'w') as f:
+        for value in dcache:
+            f.write(value + "\n")
+
+    #writing metrics - variables to output.txt
+    with open('output.txt', 'w') as f:
+        write_metrics(f)
+        if( SAMPLING is not None ):
+            write_estimates(f, estimates)
+        elif( COMPARE ):
+            write_forwarding(f, table)
+            write_predictors(f, predictor_table)
+        else:
+            write_predictors(f)
+
+
+if __name__ == '__main__':
+    main()
 ###################  END of file ##################################
@@ -0,0 +1,27 @@
+import os
+import random
+import sys
+
+import pytest
+
+#the simulator modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_trace(seed, length = 3000):
+    #(address, access_type) requests with reuse , strides and random jumps
+    rng = random.Random(seed)
+    trace = []
+    addr = 0
+    for _ in range(length):
+        pick = rng.random()
+        if( pick < 0.4 ): addr += 4                            #sequential
+        elif( pick < 0.7 ): addr = rng.randrange(1 << 12)      #small working set
+        elif( pick < 0.9 ): addr = rng.randrange(1 << 16)      #far jump
+        trace.append((addr & 0xfffc, 1 if rng.random() < 0.3 else 0))
+    return trace
+
+
+@pytest.fixture(params = [1, 2, 3])
+def trace(request):
+    return make_trace(request.param)
@@ -0,0 +1,61 @@
+import pytest
+
+import cache_HakeshED as ch
+
+
+def replay(cache, trace):
+    for addr, access_type in trace:
+        cache.access_addr(addr, access_type)
+    return cache.metrics
+
+
+def three_c(trace, num_blocks, block_size):
+    #reference classification : a miss of a block seen before is a capacity
+    #miss when a fully associative LRU cache of num_blocks misses it too
+    seen, lru = set(), []
+    kinds = []
+    for addr, _ in trace:
+        block = addr // block_size
+        kinds.append(None if block not in seen else 'capacity_miss' if block not in lru else 'conflict_miss')
+        seen.add(block)
+        if( block in lru ): lru.remove(block)
+        lru.append(block)
+        del lru[:-num_blocks]
+    return kinds
+
+
+@pytest.mark.parametrize("associativity, policy", [(1, 1), (2, 1), (4, 2), (4, 0)])
+def test_exact_3c_matches_a_fully_associative_reference(trace, associativity, policy):
+    cache = ch.Cache(associativity, policy, 512, 16, exact_3c = True)
+    for (addr, access_type), kind in zip(trace, three_c(trace, 32, 16)):
+        before = list(cache.metrics.counts)
+        cache.access_addr(addr, access_type)
+        if( cache.metrics.cache_miss == before[ch.CACHE_MISS] ): continue
+        index = ch.METRIC_INDEX[kind or 'compulsory_miss']
+        assert cache.metrics.counts[index] == before[index] + 1, (addr, kind)
+
+    metrics = cache.metrics
+    assert metrics.compulsory_miss + metrics.capacity_miss + metrics.conflict_miss == metrics.cache_miss
+
+
+def test_a_fully_associative_lru_cache_has_no_conflict_misses(trace):
+    metrics = replay(ch.Cache(0, 1, 512, 16, exact_3c = True), trace)
+    assert metrics.conflict_miss == 0
+    assert metrics.capacity_miss == metrics.cache_miss - metrics.compulsory_miss
+
+
+def test_conflict_and_capacity_by_hand():
+    #4 blocks direct mapped : 0x0 and 0x40 share a set , then an 8 block loop
+    cache = ch.Cache(1, 1, 64, 16, exact_3c = True)
+    metrics = replay(cache, [(0x0, 0), (0x40, 0), (0x0, 0)])
+    assert (metrics.compulsory_miss, metrics.conflict_miss, metrics.capacity_miss) == (2, 1, 0)
+
+    cache = ch.Cache(1, 1, 64, 16, exact_3c = True)
+    metrics = replay(cache, [(addr, 0) for addr in range(0, 0x80, 0x10)] * 2)
+    assert (metrics.compulsory_miss, metrics.capacity_miss, metrics.conflict_miss) == (8, 8, 0)
+
+
+def test_without_the_shadow_repeat_misses_are_conflicts(trace):
+    metrics = replay(ch.Cache(2, 1, 512, 16), trace)
+    assert metrics.capacity_miss == 0
+    assert metrics.conflict_miss == metrics.cache_miss - metrics.compulsory_miss
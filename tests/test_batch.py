@@ -0,0 +1,34 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import cache_HakeshED as ch
+
+
+def set_state(cache):
+    blocks = cache.bbox.blocks
+    return list(blocks.tags), bytes(blocks.valid_bits), bytes(blocks.dirty_bits)
+
+
+@pytest.mark.parametrize("exact_3c", [False, True])
+@pytest.mark.parametrize("cache_size, block_size", [(64, 16), (1024, 16), (4096, 64)])
+@pytest.mark.parametrize("policy", [0, 1, 2])
+def test_batch_matches_per_access(trace, policy, cache_size, block_size, exact_3c):
+    random.seed(1)
+    reference = ch.Cache(1, policy, cache_size, block_size, exact_3c = exact_3c)
+    for addr, access_type in trace:
+        reference.access_addr(addr, access_type)
+
+    #two batches around a few single accesses , so a batch starts from a used cache
+    cache = ch.Cache(1, policy, cache_size, block_size, exact_3c = exact_3c)
+    addresses = np.array([addr for addr, _ in trace])
+    writes = np.array([access_type for _, access_type in trace])
+    third = len(trace) // 3
+    cache.access_batch(addresses[:third], writes[:third])
+    for addr, access_type in trace[third:third + 50]:
+        cache.access_addr(addr, access_type)
+    cache.access_batch(addresses[third + 50:], np.where(writes[third + 50:] == 1, 'w', 'r'))
+
+    assert cache.metrics.as_dict() == reference.metrics.as_dict()
+    assert set_state(cache) == set_state(reference)
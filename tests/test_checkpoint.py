@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+import cache_HakeshED as ch
+
+
+def chunked(trace, size = 250):
+    return [trace[i:i + size] for i in range(0, len(trace), size)]
+
+
+def crashing(chunks, after):
+    #the chunks of a run that dies once after chunks have been handed out
+    for i, chunk in enumerate(chunks):
+        if( i == after ): raise KeyboardInterrupt
+        yield chunk
+
+
+@pytest.mark.parametrize("policy", [0, 1, 2])
+def test_resumed_replay_matches_an_uninterrupted_one(tmp_path, trace, policy):
+    random.seed(5)
+    plain = ch.Cache(4, policy, 1024, 16)
+    for addr, access_type in trace:
+        plain.access_addr(addr, access_type)
+
+    random.seed(5)
+    saver = ch.checkpoint(str(tmp_path / 'run.ckpt'), every = 700)
+    with pytest.raises(KeyboardInterrupt):
+        saver.replay(ch.Cache(4, policy, 1024, 16), crashing(chunked(trace), 7))
+    assert saver.position == 1400
+
+    #a new process , the cache handed in is replaced by the saved one
+    random.seed(99)
+    saver = ch.checkpoint(str(tmp_path / 'run.ckpt'), every = 700)
+    cache = saver.replay(ch.Cache(4, policy, 1024, 16), chunked(trace))
+    assert cache.metrics.counts == plain.metrics.counts
+    assert list(cache.bbox.blocks.tags) == list(plain.bbox.blocks.tags)
+    assert cache.bbox.blocks.dirty_bits == plain.bbox.blocks.dirty_bits
+
+
+def test_restore_forks_identical_runs(trace):
+    cache = ch.Cache(2, 0, 512, 16)
+    for addr, access_type in trace[:1000]:
+        cache.access_addr(addr, access_type)
+    data = ch.snapshot(cache)
+
+    forks = []
+    for _ in range(2):
+        fork = ch.restore(data)
+        for addr, access_type in trace[1000:]:
+            fork.access_addr(addr, access_type)
+        forks.append(fork.metrics.counts)
+    assert forks[0] == forks[1]
+    assert cache.metrics.cache_access == 1000
+
+
+def test_restore_rejects_other_data():
+    with pytest.raises(ValueError):
+        ch.restore(b'not a snapshot')
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+
+import cache_HakeshED as ch
+
+
+def logged(trace, **options):
+    #replays trace through a 4-way LRU cache with an event log attached
+    cache = ch.Cache(4, 1, 1024, 16)
+    f = io.BytesIO() if options.get('fmt') == 'binary' else io.StringIO()
+    log = ch.event_log(f, buffer_size = 100, **options)
+    cache.attach_log(log)
+    for addr, access_type in trace:
+        cache.access_addr(addr, access_type)
+    log.close()
+    return cache, f.getvalue()
+
+
+def csv_events(text):
+    lines = text.splitlines()
+    assert lines[0] == "index,address,access_type,set_num,tag,status"
+    return [tuple(int(value, 0) for value in line.split(",")) for line in lines[1:]]
+
+
+def test_log_changes_nothing_but_the_sink(trace):
+    plain = ch.Cache(4, 1, 1024, 16)
+    for addr, access_type in trace:
+        plain.access_addr(addr, access_type)
+    cache, _ = logged(trace)
+    assert cache.metrics.counts == plain.metrics.counts
+
+
+def test_every_access_is_logged(trace):
+    cache, text = logged(trace)
+    events = csv_events(text)
+    assert [event[0] for event in events] == list(range(len(trace)))
+    assert [(event[1], event[2]) for event in events] == trace
+    assert sum(1 for event in events if event[5] != 1) == cache.metrics.cache_miss
+    for index, addr, access_type, set_num, tag, status in events:
+        assert (set_num, tag) == (cache.bbox.set_num(addr), cache.bbox.tag(addr))
+
+
+def test_misses_only_and_sampling(trace):
+    cache, text = logged(trace, level = ch.LOG_MISSES)
+    events = csv_events(text)
+    assert len(events) == cache.metrics.cache_miss
+    assert all(event[5] != 1 for event in events)
+
+    _, text = logged(trace, sample = 10)
+    assert [event[0] for event in csv_events(text)] == list(range(0, len(trace), 10))
+
+
+def test_binary_events_match_csv(trace):
+    _, text = logged(trace)
+    _, data = logged(trace, fmt = 'binary')
+    assert len(data) == len(trace) * ch.event_log.EVENT.size
+    assert list(ch.event_log.EVENT.iter_unpack(data)) == csv_events(text)
+
+
+def test_detached_and_off_logs_record_nothing(trace):
+    cache = ch.Cache(4, 1, 1024, 16)
+    cache.attach_log(ch.event_log(io.StringIO(), level = ch.LOG_OFF))
+    assert type(cache.replacer) is ch.replacer
+
+    f = io.StringIO()
+    log = ch.event_log(f)
+    cache.attach_log(log)
+    cache.detach_log()
+    assert type(cache.replacer) is ch.replacer
+    for addr, access_type in trace:
+        cache.access_addr(addr, access_type)
+    log.close()
+    assert len(f.getvalue().splitlines()) == 1
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        ch.event_log(io.StringIO(), fmt = 'json')
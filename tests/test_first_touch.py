@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import cache_HakeshED as ch
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_set_and_bitmap_agree_with_a_plain_set(batch):
+    #20 offset bits : 4096 blocks in the 32 bit space , the bitmap takes over past 8
+    touched = ch.first_touch(20)
+    seen = set()
+    rng = random.Random(1)
+    for _ in range(200):
+        blocks = [rng.randrange(5000) for _ in range(rng.randrange(1, 6))]
+        if( batch ):
+            assert touched.touch_many(set(blocks)) == len(set(blocks) - seen)
+            seen.update(blocks)
+        else:
+            for block in blocks:
+                assert touched.touch(block) == (block not in seen)
+                seen.add(block)
+        assert touched.count == len(seen)
+    assert touched.mode() == 'bitmap'
+    #only blocks past the 32 bit space stay in the set
+    assert touched.blocks == {block for block in seen if block >= 4096}
+
+
+def test_sparse_traces_stay_in_set_mode():
+    touched = ch.first_touch(20)
+    for block in range(8):
+        touched.touch(block)
+    assert touched.mode() == 'set' and touched.bitmap is None
+    touched.touch(8)
+    assert touched.mode() == 'bitmap'
+    assert not touched.touch(3) and touched.count == 9
+
+
+def test_compulsory_misses_are_distinct_blocks(trace):
+    cache = ch.Cache(4, 1, 1024, 16)
+    for addr, access_type in trace:
+        cache.access_addr(addr, access_type)
+    assert cache.metrics.compulsory_miss == len({addr >> 4 for addr, _ in trace})
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import cache_HakeshED as ch
+
+
+def cached(cache):
+    #addresses of the blocks held by a cache
+    bbox = cache.bbox
+    blocks = bbox.blocks
+    return {(blocks.tags[slot] << bbox.tag_shift) | ((slot // blocks.ways) << bbox.set_shift)
+            for slot in range(len(blocks.tags)) if blocks.valid_bits[slot]}
+
+
+def covered(cache, block_size):
+    #the same blocks , split into blocks of block_size bytes
+    return {a for base in cached(cache) for a in range(base, base + cache.block_size, block_size)}
+
+
+def run(levels, mode, trace):
+    random.seed(0)
+    hierarchy = ch.CacheHierarchy(levels, [1, 10, 30][:len(levels)], 200, mode)
+    for addr, access_type in trace:
+        hierarchy.access_addr(addr, access_type)
+    return hierarchy
+
+
+@pytest.mark.parametrize("policies", [(1, 1, 1), (0, 2, 1)])
+def test_inclusive_levels_hold_the_levels_above(trace, policies):
+    levels = [ch.Cache(2, policies[0], 256, 16), ch.Cache(4, policies[1], 1024, 32), ch.Cache(8, policies[2], 4096, 32)]
+    run(levels, 'inclusive', trace)
+    assert covered(levels[0], 16) <= covered(levels[1], 16)
+    assert cached(levels[1]) <= cached(levels[2])
+
+
+@pytest.mark.parametrize("policies", [(1, 1, 1), (0, 2, 1)])
+def test_exclusive_levels_are_disjoint(trace, policies):
+    levels = [ch.Cache(2, policies[0], 256, 16), ch.Cache(4, policies[1], 1024, 16), ch.Cache(0, policies[2], 4096, 16)]
+    hierarchy = run(levels, 'exclusive', trace)
+    blocks = [cached(cache) for cache in levels]
+    assert not (blocks[0] & blocks[1]) and not (blocks[1] & blocks[2]) and not (blocks[0] & blocks[2])
+    assert hierarchy.demand_accesses[0] == len(trace)
+
+
+def test_exclusive_needs_one_block_size():
+    with pytest.raises(ValueError):
+        ch.CacheHierarchy([ch.Cache(1, 1, 16, 16), ch.Cache(0, 1, 128, 32)], [1, 10], 100, 'exclusive')
+
+
+def test_one_level_matches_a_plain_cache(trace):
+    random.seed(1)
+    cache = ch.Cache(4, 1, 1024, 16)
+    hierarchy = ch.CacheHierarchy([cache], [1], 100)
+    for addr, access_type in trace:
+        hierarchy.access_addr(addr, access_type)
+
+    random.seed(1)
+    plain = ch.Cache(4, 1, 1024, 16)
+    for addr, access_type in trace:
+        plain.access_addr(addr, access_type)
+
+    assert cache.metrics.as_dict() == plain.metrics.as_dict()
+    assert hierarchy.memory_reads == plain.metrics.cache_miss
+    assert hierarchy.memory_writes == plain.metrics.dirty_evicted
+
+
+def test_write_back_installs_without_reading():
+    #0x0 and 0x20 share the one L2 set , the dirty 0x0 comes back to L2 after 0x20 replaced it
+    hierarchy = ch.CacheHierarchy([ch.Cache(1, 1, 16, 16), ch.Cache(1, 1, 32, 16)], [1, 10], 100)
+    hierarchy.access_addr(0x0, 1)
+    hierarchy.access_addr(0x20, 0)
+    assert hierarchy.memory_reads == 2
+    assert hierarchy.memory_writes == 0
+    assert hierarchy.levels[1].metrics.write_miss == 1
+
+
+@pytest.mark.parametrize("mode", ch.CacheHierarchy.MODES)
+@pytest.mark.parametrize("policy", [0, 1, 2])
+def test_dirty_block_reaches_memory(mode, policy):
+    hierarchy = ch.CacheHierarchy([ch.Cache(1, policy, 16, 16), ch.Cache(4, policy, 64, 16)], [1, 10], 100, mode)
+    hierarchy.access_addr(0x0, 1)
+    hierarchy.access_addr(0x100, 0)
+    hierarchy.access_addr(0x0, 0)
+    for addr in range(0x1000, 0x2000, 16):
+        hierarchy.access_addr(addr, 0)
+    assert hierarchy.memory_writes == 1
@@ -0,0 +1,78 @@
+import io
+
+import pytest
+
+import cache_HakeshED as ch
+
+
+def replay(cache, trace):
+    for addr, access_type in trace:
+        cache.access_addr(addr, access_type)
+
+
+@pytest.mark.parametrize("every, access", [(250, list(range(250, 3001, 250))), (700, [700, 1400, 2100, 2800, 3000])])
+def test_rows_are_running_totals(trace, every, access):
+    cache = ch.Cache(4, 1, 1024, 16)
+    cache.attach_stats(every)
+    replay(cache, trace)
+    stats = cache.detach_stats()
+
+    assert list(stats.columns['access']) == access
+    #the last (partial) row holds the final counters
+    assert [stats.columns[name][-1] for name in ch.METRIC_NAMES] == cache.metrics.counts
+    for name in ch.METRIC_NAMES:
+        column = list(stats.columns[name])
+        assert column == sorted(column), name
+
+    #every heatmap row splits the misses of its interval over the sets
+    misses = [0] + list(stats.columns['cache_miss'])
+    heatmap = stats.heatmap()
+    assert len(heatmap) == stats.rows() and len(heatmap[0]) == cache.bbox.num_sets
+    assert [sum(row) for row in heatmap] == [b - a for a, b in zip(misses, misses[1:])]
+
+
+def test_totals_run_through_a_warmup(trace):
+    cache = ch.Cache(4, 1, 1024, 16)
+    cache.start_warmup(1000)
+    cache.attach_stats(500)
+    replay(cache, trace)
+    stats = cache.detach_stats()
+
+    plain = ch.Cache(4, 1, 1024, 16)
+    replay(plain, trace)
+    assert [stats.columns[name][-1] for name in ch.METRIC_NAMES] == plain.metrics.counts
+    assert stats.columns['cache_access'][1] == 1000
+
+
+def test_csv_and_binary_round_trip(tmp_path, trace):
+    cache = ch.Cache(2, 2, 512, 16)
+    cache.attach_stats(400)
+    replay(cache, trace)
+    stats = cache.detach_stats()
+
+    f = io.StringIO()
+    stats.write_csv(f)
+    lines = f.getvalue().splitlines()
+    assert lines[0].split(",") == ['access'] + list(ch.METRIC_NAMES)
+    assert [int(line.split(",")[0]) for line in lines[1:]] == list(stats.columns['access'])
+
+    f = io.StringIO()
+    stats.write_heatmap_csv(f)
+    lines = f.getvalue().splitlines()
+    assert len(lines) == 1 + stats.rows() and len(lines[0].split(",")) == 1 + cache.bbox.num_sets
+
+    path = tmp_path / 'intervals.bin'
+    with open(path, 'wb') as g:
+        stats.write_binary(g)
+    columns, heatmap, num_sets = ch.read_intervals(str(path))
+    assert columns == stats.columns
+    assert heatmap == stats.heatmap_rows and num_sets == cache.bbox.num_sets
+
+
+def test_bad_intervals_and_files(tmp_path):
+    with pytest.raises(ValueError):
+        ch.Cache(4, 1, 1024, 16).attach_stats(0)
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        ch.read_intervals(str(path))
@@ -0,0 +1,252 @@
+import pytest
+
+import pipelining as pl
+
+#R2 counts down from 5 : SUB R2 R2 R3 , BEQZ R2 +1 , JMP -3 , HLT
+LOOP = "1223 b201 afd0 f000"
+
+
+def load(program, registers = {}, memory = {}):
+    #program is hex instruction words , the rest of the memories and registers are 0
+    code = [word[i:i + 2] for word in program.split() for i in (0, 2)]
+    pl.lcache = code + ['00'] * (256 - len(code))
+    pl.dcache = ['00'] * 256
+    for address, value in memory.items(): pl.dcache[address] = format(value, '02x')
+    pl.RF = [0] * 16
+    for register, value in registers.items(): pl.RF[register] = value
+    pl.reset()
+
+
+@pytest.fixture(autouse = True)
+def perfect_caches(monkeypatch):
+    #no cache stalls , the hazards alone decide the timing
+    monkeypatch.setattr(pl, 'ICACHE_MISS_PENALTY', 0)
+    monkeypatch.setattr(pl, 'DCACHE_MISS_PENALTY', 0)
+
+
+@pytest.mark.parametrize("name, mispredictions", [('not-taken', 5), ('1-bit', 2), ('2-bit', 2), ('gshare', 2)])
+def test_predictor_mispredictions(name, mispredictions):
+    load(LOOP, {2 : 5, 3 : 1})
+    pl.reset(name)
+    pl.run()
+    assert pl.instructions == 15 and pl.halted
+    assert pl.predictions == 9
+    assert pl.mispredictions == mispredictions
+
+
+def test_predictor_saves_control_stalls():
+    load(LOOP, {2 : 5, 3 : 1})
+    pl.reset('none')
+    pl.run()
+    assert pl.predictions == 0
+    waiting = pl.control_stalls
+
+    load(LOOP, {2 : 5, 3 : 1})
+    pl.reset('2-bit')
+    pl.run()
+    #only the two mispredicted branches keep fetch waiting
+    assert pl.control_stalls < waiting
+
+
+def write_program(path):
+    (path / 'lcache.txt').write_text("\n".join("81 00 b1 03 11 12 33 00 af c0 93 01 f0 00".split()) + "\n")
+    (path / 'dcache.txt').write_text("05\n05\n")
+    (path / 'RF.txt').write_text("00\n00\n01\n")
+
+
+@pytest.mark.parametrize("compare, runs", [(False, 1), (True, 9)])
+def test_main_runs_the_program_once_unless_compare(tmp_path, monkeypatch, compare, runs):
+    write_program(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pl, 'COMPARE', compare)
+    calls = []
+    run = pl.run
+    monkeypatch.setattr(pl, 'run', lambda *args, **kwargs: calls.append(args) or run(*args, **kwargs))
+    pl.main()
+
+    output = (tmp_path / 'output.txt').read_text()
+    assert len(calls) == runs
+    assert "Total number of instructions executed: 24" in output
+    assert ("Control stalls per branch predictor" in output) == compare
+    assert ("Data stalls per forwarding mode" in output) == compare
+
+
+def test_fetch_stage_matches_run(monkeypatch):
+    #run fetches through InstructionFetch , stepping it by hand gives the
+    #same instruction cache stalls and next PCs
+    monkeypatch.setattr(pl, 'ICACHE_MISS_PENALTY', 10)
+    load(LOOP, {2 : 5, 3 : 1})
+    pl.reset('none')
+    waits = []
+    for pc in (0, 2, 4, 6):
+        pl.PC = pc
+        waits.append(pl.InstructionFetch())
+        assert pl.PC == pl.predicted_PC == pc + 2
+    assert waits[0] == 10 and sum(waits) == pl.icache_stalls
+
+    load(LOOP, {2 : 5, 3 : 1})
+    pl.reset('none')
+    pl.run()
+    assert pl.icache_stalls == sum(waits)
+    assert pl.IR == "f000" and pl.RF[2] == 0
+
+
+#R2 counts down from 200 , ADD R4 R2 R2 reads the SUB result straight away
+DEPENDENT_LOOP = "1223 0422 b201 afc0 f000"
+
+
+@pytest.mark.parametrize("warmup", [0, 10])
+def test_sample_uses_the_forwarding_mode(warmup):
+    estimates = {}
+    for forwarding in pl.FORWARDING_MODES:
+        load(DEPENDENT_LOOP, {2 : 200, 3 : 1})
+        pl.reset('2-bit')
+        pl.run(forwarding = forwarding)
+        exact = pl.cpi
+
+        load(DEPENDENT_LOOP, {2 : 200, 3 : 1})
+        pl.reset('2-bit')
+        estimates[forwarding] = pl.sample(50, 20, warmup, forwarding = forwarding)['cpi'][0]
+        assert pl.instructions == 800
+        assert estimates[forwarding] == pytest.approx(exact, abs = 0.1)
+    assert estimates['none'] > estimates['ex'] > estimates['full']
+
+
+#R1 = 3 + 4 (or the 7 at address 3) , R4 = R1 + R1 , with an unrelated ADD
+#between them in the last program
+@pytest.mark.parametrize("program, stalls", [
+    ("0123 0411 f000", {'none' : 3, 'ex' : 0, 'full' : 0}),        #ALU -> ALU
+    ("8120 0411 f000", {'none' : 3, 'ex' : 3, 'full' : 1}),        #LOAD -> ALU
+    ("0123 0555 0411 f000", {'none' : 2, 'ex' : 2, 'full' : 0}),   #ALU -> one apart -> ALU
+])
+def test_forwarding_data_stalls(program, stalls):
+    for forwarding, expected in stalls.items():
+        load(program, {2 : 3, 3 : 4}, {3 : 7})
+        pl.reset('none')
+        pl.run(forwarding = forwarding)
+        assert pl.data_stalls == pl.stalls == expected
+        assert pl.RF[4] == 14
+
+
+def test_checkpointed_run_resumes_where_it_stopped(tmp_path, monkeypatch):
+    #full miss penalties , the caches and the predictor are part of the snapshot
+    monkeypatch.setattr(pl, 'ICACHE_MISS_PENALTY', 10)
+    monkeypatch.setattr(pl, 'DCACHE_MISS_PENALTY', 10)
+    load(DEPENDENT_LOOP, {2 : 200, 3 : 1})
+    pl.reset('2-bit')
+    pl.run()
+    expected = (pl.clockCycles, pl.instructions, pl.stalls, pl.data_stalls, pl.control_stalls,
+                pl.icache_stalls, pl.mispredictions, list(pl.RF))
+
+    #the first attempt dies after three slices
+    run, slices = pl.run, []
+    def crashing(*args):
+        if( len(slices) == 3 ): raise KeyboardInterrupt
+        slices.append(args)
+        return run(*args)
+    monkeypatch.setattr(pl, 'run', crashing)
+    load(DEPENDENT_LOOP, {2 : 200, 3 : 1})
+    pl.reset('2-bit')
+    with pytest.raises(KeyboardInterrupt):
+        pl.run_checkpointed(str(tmp_path / 'pipe.ckpt'), every = 70)
+    monkeypatch.setattr(pl, 'run', run)
+
+    #the second starts from a fresh program and picks up the snapshot
+    load(DEPENDENT_LOOP, {2 : 200, 3 : 1})
+    pl.reset('2-bit')
+    pl.run_checkpointed(str(tmp_path / 'pipe.ckpt'), every = 70)
+    assert (pl.clockCycles, pl.instructions, pl.stalls, pl.data_stalls, pl.control_stalls,
+            pl.icache_stalls, pl.mispredictions, list(pl.RF)) == expected
+
+
+@pytest.mark.parametrize("program, fetches, icache_misses, data, dcache_misses", [
+    #two instructions share the first 4 byte block , HLT starts the second
+    ("0123 0411 f000", 3, 2, (0, 0), 0),
+    #LOAD 3 misses , LOAD 3 hits , STORE 4 misses in the next block
+    ("8120 8120 9130 f000", 4, 2, (2, 1), 2),
+])
+def test_split_caches_see_their_own_accesses(monkeypatch, program, fetches, icache_misses, data, dcache_misses):
+    monkeypatch.setattr(pl, 'ICACHE_MISS_PENALTY', 10)
+    monkeypatch.setattr(pl, 'DCACHE_MISS_PENALTY', 10)
+    load(program, {2 : 3, 3 : 4}, {3 : 7})
+    pl.reset('none')
+    pl.run()
+    icache, dcache = pl.icache.metrics, pl.dcache_timing.metrics
+    assert (icache.read_access, icache.write_access, icache.cache_miss) == (fetches, 0, icache_misses)
+    assert (dcache.read_access, dcache.write_access, dcache.cache_miss) == data + (dcache_misses,)
+    assert pl.icache_stalls == 10 * icache_misses
+    assert pl.dcache_stalls == 10 * dcache_misses
+
+    #the miss penalties are all that separates the run from one with perfect
+    #caches , a fetch miss can overlap a data miss and hide behind it
+    cycles, stalls = pl.clockCycles, pl.stalls
+    monkeypatch.setattr(pl, 'ICACHE_MISS_PENALTY', 0)
+    monkeypatch.setattr(pl, 'DCACHE_MISS_PENALTY', 0)
+    load(program, {2 : 3, 3 : 4}, {3 : 7})
+    pl.reset('none')
+    pl.run()
+    assert cycles - pl.clockCycles == stalls - pl.stalls
+    assert 10 * max(icache_misses, dcache_misses) <= stalls - pl.stalls <= 10 * (icache_misses + dcache_misses)
+
+
+#STORE R1 at R2 + 0 , two ADD R0 R0 R0 , ADD R4 R5 R5 , HLT : with R1 = R2 = 6
+#the store turns the ADD into ADD R6 R5 R5 when code and data share a memory
+SELF_MODIFYING = "9120 0000 0000 0455 f000"
+
+
+@pytest.mark.parametrize("mode", ['run', 'functional'])
+@pytest.mark.parametrize("shared, written", [(False, 4), (True, 6)])
+def test_a_store_to_code_is_decoded_again(mode, shared, written):
+    load(SELF_MODIFYING, {1 : 6, 2 : 6, 5 : 2})
+    if( shared ): pl.dcache = pl.lcache
+    pl.reset('none')
+    getattr(pl, mode)()
+    assert pl.instructions == 5
+    assert pl.RF[written] == 4 and pl.RF[10 - written] == 0
+
+
+def test_a_new_program_is_decoded_afresh():
+    load(LOOP, {2 : 5, 3 : 1})
+    pl.run()
+    load("0123 f000", {2 : 3, 3 : 4})
+    pl.run()
+    assert pl.decoded_from is pl.lcache
+    assert pl.instructions == 2 and pl.RF[1] == 7
+
+
+COUNTERS = ('arthmetic_instructions', 'logical_instructions', 'data_instructions', 'control_instructions', 'halt_instructions')
+
+
+def test_dispatch_table_matches_the_chain():
+    pl.reset()
+    pl.PC = 0x42
+
+    def counted(execute, *args):
+        #result of execute and the instruction class counters it moved
+        before = [getattr(pl, name) for name in COUNTERS]
+        result = execute(*args)
+        return result, [getattr(pl, name) - value for name, value in zip(COUNTERS, before)]
+
+    operands = [(A, B) for A in (0, 1, 0x7f, 0x80, 0xff) for B in (-128, -3, 0, 1, 7, 0xff)]
+    for opcode in range(16):
+        if( pl.EXECUTE[opcode] is pl.execute_invalid ): continue
+        for A, B in operands:
+            result, moved = counted(pl.execute_chain, opcode, A, B)
+            assert sum(moved) == 1
+            assert counted(pl.EXECUTE[opcode], A, B) == (result, moved), (opcode, A, B)
+
+
+@pytest.mark.parametrize("word", ["c000", "d123", "e0ff"])
+def test_invalid_opcodes_stop_the_run(word):
+    load("0123 " + word + " f000", {2 : 3, 3 : 4})
+    with pytest.raises(ValueError, match = "invalid opcode %d at PC 2" % int(word[0], 16)):
+        pl.run()
+    with pytest.raises(ValueError, match = "invalid opcode"):
+        pl.execute_chain(int(word[0], 16), 0, 0)
+
+
+def test_benchmark_leaves_the_counters_alone():
+    pl.reset()
+    chain, table = pl.benchmark_execute(2048)
+    assert chain > 0 and table > 0
+    assert [getattr(pl, name) for name in COUNTERS] == [0] * 5
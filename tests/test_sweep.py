@@ -0,0 +1,75 @@
+import io
+import random
+
+import pytest
+
+import cache_HakeshED as ch
+
+CACHE_SIZES = [256, 1024, 4096]
+BLOCK_SIZES = [16, 64]
+ASSOCIATIVITIES = [0, 1, 2, 4, 8]
+
+
+@pytest.mark.parametrize("exact_3c", [False, True])
+def test_sweep_matches_per_config(trace, exact_3c):
+    half = len(trace) // 2
+    table = ch.sweep_lru([trace[:half], trace[half:]], BLOCK_SIZES, CACHE_SIZES, ASSOCIATIVITIES, exact_3c)
+    assert len(table) == 29
+
+    for (cache_size, block_size, associativity), metrics in table.items():
+        cache = ch.Cache(associativity, 1, cache_size, block_size, exact_3c = exact_3c)
+        for addr, access_type in trace:
+            cache.access_addr(addr, access_type)
+        assert metrics.as_dict() == cache.metrics.as_dict(), (cache_size, block_size, associativity)
+
+
+@pytest.mark.parametrize("shape, expected", [
+    ((1024, 16, 0), (1, 64)),           #fully associative
+    ((1024, 16, 4), (16, 4)),
+    ((1024, 24, 1), None),              #block size not a power of two
+    ((1024, 16, 3), None),              #ways not a power of two
+    ((768, 16, 1), None),               #48 sets
+    ((1024, 16, 128), None),            #more ways than blocks
+])
+def test_cache_shape(shape, expected):
+    assert ch.cache_shape(*shape) == expected
+
+
+def test_sweep_skips_shapes_a_cache_can_not_have(trace):
+    table = ch.sweep_lru([trace], [16], [256, 768], [1, 3, 32])
+    assert sorted(table) == [(256, 16, 1)]
+
+
+def test_sweep_csv_has_one_row_per_config(trace):
+    table = ch.sweep_lru([trace], [16, 32], [256], [1, 2])
+    f = io.StringIO()
+    ch.write_sweep_csv(table, f)
+    lines = f.getvalue().splitlines()
+    header = lines[0].split(",")
+    assert header[:4] == ["cache_size", "block_size", "associativity", "cache_access"]
+    assert len(lines) == 1 + len(table)
+    for line, key in zip(lines[1:], sorted(table)):
+        row = dict(zip(header, map(int, line.split(","))))
+        assert (row["cache_size"], row["block_size"], row["associativity"]) == key
+        assert row["cache_miss"] == table[key].cache_miss
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_parallel_sweep_matches_per_config(tmp_path, trace, binary):
+    path = tmp_path / 'input.txt'
+    path.write_text("1024\n16\n1\n1\n" + "".join("%x %s\n" % (addr, "w" if access_type else "r") for addr, access_type in trace))
+    path = str(path)
+    if( binary ):
+        ch.write_binary_trace(path, str(tmp_path / 'input.trace'))
+        path = str(tmp_path / 'input.trace')
+
+    table = ch.sweep_parallel(path, [256, 1024], [16], [1, 4, 32], [0, 1, 2], processes = 2, seed = 7)
+    #32 ways do not fit in 256 bytes of 16 byte blocks
+    assert len(table) == 5 * 3
+
+    for (cache_size, block_size, associativity, policy), metrics in table.items():
+        random.seed(7)
+        cache = ch.Cache(associativity, policy, cache_size, block_size)
+        for addr, access_type in trace:
+            cache.access_addr(addr, access_type)
+        assert metrics.counts == cache.metrics.counts, (cache_size, associativity, policy)
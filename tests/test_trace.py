@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+import cache_HakeshED as ch
+
+#a commented header , then requests mixed with lines the reader skips
+INPUT = """# cache size , block size , associativity , policy
+1024
+
+16  # bytes
+4
+1
+0x10 r
+
+20 w    # a store
+zz r
+30 x
+40
+50 r extra
+"""
+
+
+def write_input(path, trace, header = (1024, 16, 4, 1)):
+    #an input file in the text format of the assignment
+    lines = [str(value) for value in header]
+    lines += ["%x %s" % (addr, "w" if access_type else "r") for addr, access_type in trace]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_reader_skips_comments_blank_and_bad_lines():
+    trace = ch.trace_reader(io.StringIO(INPUT))
+    assert (trace.cache_size, trace.block_size, trace.associativity, trace.replacement_policy) == (1024, 16, 4, 1)
+    assert list(trace) == [[(0x10, 0), (0x20, 1), (0x50, 0)]]
+
+
+def test_reader_yields_bounded_chunks(trace):
+    text = "1024\n16\n4\n1\n" + "".join("%x %s\n" % (addr, "w" if access_type else "r") for addr, access_type in trace)
+    chunks = list(ch.trace_reader(io.StringIO(text), chunk_size = 700))
+    assert [len(chunk) for chunk in chunks] == [700] * 4 + [200]
+    assert [request for chunk in chunks for request in chunk] == trace
+
+
+def test_reader_rejects_a_short_header():
+    with pytest.raises(ValueError):
+        ch.trace_reader(io.StringIO("1024\n16\n# no more\n"))
+
+
+def test_binary_trace_round_trip(tmp_path, trace):
+    text = write_input(tmp_path / 'input.txt', trace, (2048, 32, 2, 2))
+    path = str(tmp_path / 'input.trace')
+    assert ch.write_binary_trace(text, path) == len(trace)
+
+    binary = ch.binary_trace(path, chunk_size = 1000)
+    assert (binary.cache_size, binary.block_size, binary.associativity, binary.replacement_policy) == (2048, 32, 2, 2)
+    assert binary.count == len(trace)
+    assert [len(chunk) for chunk in binary] == [1000] * 3
+    assert [request for chunk in binary for request in chunk] == trace
+    records = binary.records()
+    assert records['addr'].tolist() == [addr for addr, _ in trace]
+    assert records['op'].tolist() == [access_type for _, access_type in trace]
+
+
+def test_empty_binary_trace(tmp_path):
+    path = str(tmp_path / 'empty.trace')
+    assert ch.write_binary_trace(write_input(tmp_path / 'input.txt', []), path) == 0
+    assert list(ch.binary_trace(path)) == []
+    assert len(ch.binary_trace(path).records()) == 0
+
+
+def test_binary_trace_rejects_a_text_file(tmp_path):
+    with pytest.raises(ValueError):
+        ch.binary_trace(write_input(tmp_path / 'input.txt', [(0, 0)]))
+
+
+@pytest.mark.parametrize("associativity, policy", [(1, 1), (4, 1), (4, 2)])
+def test_replay_matches_text_requests(tmp_path, trace, associativity, policy):
+    path = str(tmp_path / 'input.trace')
+    ch.write_binary_trace(write_input(tmp_path / 'input.txt', trace), path)
+
+    cache = ch.Cache(associativity, policy, 1024, 16)
+    cache.replay(path, chunk_size = 512)
+    reference = ch.Cache(associativity, policy, 1024, 16)
+    for addr, access_type in trace:
+        reference.access_addr(addr, access_type)
+    assert cache.metrics.counts == reference.metrics.counts
@@ -0,0 +1,58 @@
+import io
+import random
+
+import cache_HakeshED as ch
+
+
+def replay(cache, trace):
+    for addr, access_type in trace:
+        cache.access_addr(addr, access_type)
+
+
+def test_warmup_and_steady_add_up_to_the_whole_run(trace):
+    random.seed(3)
+    plain = ch.Cache(4, 1, 1024, 16)
+    replay(plain, trace)
+
+    random.seed(3)
+    cache = ch.Cache(4, 1, 1024, 16)
+    cache.start_warmup(500)
+    replay(cache, trace)
+
+    assert cache.warmup_metrics.cache_access == 500
+    assert cache.metrics is cache.steady_metrics
+    assert type(cache.replacer) is ch.replacer
+    total = [w + s for w, s in zip(cache.warmup_metrics.counts, cache.steady_metrics.counts)]
+    assert total == plain.metrics.counts
+
+
+def test_detected_warmup_ends_within_its_bound(trace):
+    cache = ch.Cache(4, 1, 1024, 16)
+    cache.start_warmup(2000, 200, 0.02)
+    replay(cache, trace)
+    assert 0 < cache.warmup_references <= 2000
+    assert cache.warmup_metrics.cache_access + cache.steady_metrics.cache_access == len(trace)
+
+
+def test_detach_log_under_a_warmup(trace):
+    cache = ch.Cache(4, 1, 1024, 16)
+    f = io.StringIO()
+    log = ch.event_log(f)
+    cache.attach_log(log)
+    cache.start_warmup(len(trace))
+    replay(cache, trace[:100])
+    cache.detach_log()
+    replay(cache, trace[100:200])
+    log.close()
+    assert len(f.getvalue().splitlines()) == 1 + 100
+
+
+def test_snapshot_during_warmup_resumes_the_same(trace):
+    cache = ch.Cache(4, 1, 1024, 16)
+    cache.start_warmup(1000)
+    replay(cache, trace[:300])
+    resumed = ch.restore(ch.snapshot(cache))
+    replay(cache, trace[300:])
+    replay(resumed, trace[300:])
+    assert resumed.warmup_metrics.counts == cache.warmup_metrics.counts
+    assert resumed.steady_metrics.counts == cache.steady_metrics.counts
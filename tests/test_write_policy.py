@@ -0,0 +1,57 @@
+import pytest
+
+import cache_HakeshED as ch
+
+#4 sets of 16 bytes , 0x0 and 0x40 share set 0
+W0, R0, W0_AGAIN, R40 = (0x0, 1), (0x0, 0), (0x0, 1), (0x40, 0)
+
+
+def replay(cache, trace):
+    return [cache.access_addr(addr, access_type) for addr, access_type in trace]
+
+
+def traffic(metrics):
+    return metrics.memory_read_bytes, metrics.writeback_bytes, metrics.write_through_bytes, metrics.dirty_evicted
+
+
+@pytest.mark.parametrize("write_back, write_allocate, statuses, expected", [
+    #the dirty block goes back to memory when 0x40 takes its place
+    (True, True, [0, 1, -1], (32, 16, 0, 1)),
+    #every write is sent on , the block is never dirty
+    (False, True, [0, 1, -1], (32, 0, 8, 0)),
+    #write misses go around the cache , so 0x40 finds the set empty
+    (True, False, [-2, -2, 0], (16, 0, 8, 0)),
+    (False, False, [-2, -2, 0], (16, 0, 8, 0)),
+])
+def test_write_policies_by_hand(write_back, write_allocate, statuses, expected):
+    cache = ch.Cache(1, 1, 64, 16, write_back = write_back, write_allocate = write_allocate)
+    assert replay(cache, [W0, W0_AGAIN, R40]) == statuses
+    assert traffic(cache.metrics) == expected
+
+
+def test_a_read_allocates_for_a_later_write_through_hit():
+    cache = ch.Cache(1, 1, 64, 16, write_back = False, write_allocate = False, write_size = 8)
+    assert replay(cache, [R0, W0, R40]) == [0, 1, -1]
+    assert traffic(cache.metrics) == (32, 0, 8, 0)
+
+
+@pytest.mark.parametrize("policy", [0, 1, 2])
+def test_write_hits_make_blocks_dirty(policy):
+    #a block read in and then written must be written back , whatever the policy
+    cache = ch.Cache(2, policy, 64, 16)
+    replay(cache, [(0x0, 0), (0x0, 1), (0x20, 0), (0x40, 0), (0x60, 0)])
+    assert cache.metrics.dirty_evicted == 1 and cache.metrics.writeback_bytes == 16
+
+
+@pytest.mark.parametrize("write_back", [False, True])
+@pytest.mark.parametrize("write_allocate", [False, True])
+def test_traffic_adds_up(trace, write_back, write_allocate):
+    cache = ch.Cache(4, 1, 1024, 16, write_back = write_back, write_allocate = write_allocate)
+    statuses = replay(cache, trace)
+    metrics = cache.metrics
+    assert metrics.memory_read_bytes == 16 * sum(1 for status in statuses if status in (0, -1))
+    assert metrics.writeback_bytes == 16 * metrics.dirty_evicted
+    if( not write_back ): assert metrics.dirty_evicted == 0
+    writes_around = sum(1 for status in statuses if status == -2)
+    sent = metrics.write_access if not write_back else writes_around
+    assert metrics.write_through_bytes == 4 * sent